@@ -6,21 +6,44 @@ import os
 import matplotlib.pyplot as plt
 import plotly.express as px
 
+import prepare
+import calendar_features
+import charts
+import chart_data
+import cube
+import summaries
+
 ### Page setup ###
 st.set_page_config(page_title="Analysis Dashboard", page_icon=":bar_chart:", layout="wide")
 st.markdown('<style>div.block-container{padding-top:1.5rem;}</style>',unsafe_allow_html=True) #ปรับ top padding
 st.title("Data analysis Dashbord")
 # End Page setup #
 
+# Charts get their aggregate, never the transaction rows
+COUNTRY_SALES = chart_data.ChartSpec(dimensions=('Country',), measures={'Total Sales': ('TotalSales', 'sum')})
+PRODUCT_SALES = chart_data.ChartSpec(dimensions=('StockCode', 'Description'),
+                                     measures={'Total Quantity': ('Quantity', 'sum'),
+                                               'TotalSales per Procuct': ('TotalSales', 'sum'),
+                                               'Total orders per product': ('StockCode', 'count')})
+
+# Read, cleaned and rolled up into the sales cube once per version of the file, not on every widget change
+@st.cache_resource(max_entries=1)
+def load_transactions(path, modified):
+    data = pd.read_csv(path,encoding = "ISO-8859-1", dtype={'CustomerID': str,'InvoiceID': str})
+    data['InvoiceDate'] = pd.to_datetime(data['InvoiceDate'])
+    # dropna, drop_duplicates, TotalSales and the cancellation flag, computed once
+    prepared = prepare.prepare_transactions(data)
+    return data, prepared, cube.SalesCube.from_prepared(prepared)
+
 os.chdir(r"D:\งานเอยใด\Python\Mid_Project\data.csv")
-df = pd.read_csv("data.csv",encoding = "ISO-8859-1", dtype={'CustomerID': str,'InvoiceID': str})
-df['InvoiceDate'] = pd.to_datetime(df['InvoiceDate'])
-canceled_products = df[df['InvoiceNo'].str.contains('C', na=False)]
+data_modified = os.path.getmtime("data.csv")
+df, prepared, sales_cube = load_transactions("data.csv", data_modified)
+canceled_products = df[prepare.cancellation_mask(df['InvoiceNo'])]
 
 with st.expander("Data Preview"):
     st.markdown(f"Number of data: {len(df):,}")
     st.markdown(f"Number of products that were canceled: {len(canceled_products)}")
-    st.dataframe(df)
+    charts.paged_table(df, key='raw_preview', token=(data_modified, 'raw'))
 
 st.markdown(':rainbow[The cleansed data that was retrieved.]')
 
@@ -37,25 +60,17 @@ variables = '''This dataframe contains 8 variables that correspond to:
 st.markdown(variables)
 
 ### Cleaning data ###
-df = df.dropna()
-df = df.drop_duplicates()
-
-df['TotalSales'] = df['Quantity'] * df['UnitPrice']
-canceled_products = df[df['InvoiceNo'].str.contains('C', na=False)]
+# prepared by load_transactions
+df = prepared.frame
+canceled_products = prepared.canceled
 
 
 with st.expander("Cleaned data"):
     st.markdown(f"*Number of orders by members: {len(df):,}*")
     st.markdown(f"Number of products that were canceled: {len(canceled_products)}")
-    st.write(df)
-
-csv = df.to_csv().encode("utf-8")
-st.download_button(
-    label="Download cleaned data as CSV",
-    data=csv,
-    file_name="Cleaned E-Commerce data.csv",
-    mime="text/csv",
-)
+    charts.paged_table(df, key='cleaned', token=(data_modified, 'cleaned'))
+
+charts.export_button(df, "cleaned data", "Cleaned E-Commerce data", key='cleaned_export')
 
 
 df_summary = pd.DataFrame([{'products': len(df['StockCode'].value_counts()),    
@@ -67,10 +82,13 @@ st.dataframe(df_summary)
 
 #--------------------------------------------------------------------------------------------------------------------------
 
+# Every chart's aggregate is reported against the row-level frame it replaces
+payloads = []
+
 # Choropleth Map Example
-temp = df[['CustomerID', 'InvoiceNo', 'Country']].groupby(['CustomerID', 'InvoiceNo', 'Country']).count()
-temp = temp.reset_index(drop = False)
-countries = temp['Country'].value_counts()
+# Orders per country, counted on the invoice headers rather than the line items
+countries = prepared.invoices['Country'].value_counts()
+payloads.append(chart_data.cube_stats(sales_cube, 'Choropleth Map Example', ['Country', 'InvoiceNo'], sales_cube.n_rows, countries))
 
 # Define the data for the choropleth map
 data = dict(
@@ -117,6 +135,7 @@ sales_comparison = pd.DataFrame({
     'Status': ['Non-Canceled', 'Canceled'],
     'Total Sales': [totalSales_non_canceled, totalSales_canceled]
 })
+payloads.append(chart_data.cube_stats(sales_cube, 'Comparison of Total Sales', ['InvoiceNo', 'TotalSales'], sales_cube.n_rows, sales_comparison))
 
 st.subheader("Comparison of Total Sales")
 # graph
@@ -130,8 +149,7 @@ st.plotly_chart(fig_bar1, use_container_width=True)
 # download_button
 with st.expander("View Data of Comparison of Total Sales:"):
         st.write(sales_comparison.style.background_gradient(cmap = "Blues"))
-        csv = sales_comparison.to_csv(index = False).encode("utf-8")
-        st.download_button('Download Data' , data = csv , file_name = "Comparison_TotalSales.csv" , mime = 'text/csv')
+        charts.export_button(sales_comparison, "data", "Comparison_TotalSales", key='comparison_export', index=False)
 
 #--------------------------------------------------------------------------------------------------------------------------
 
@@ -139,28 +157,28 @@ with st.expander("View Data of Comparison of Total Sales:"):
 
 cl1 , cl2 = st.columns(2)
 with cl1:
-    df = df[~df.isin(canceled_products)].dropna()
+    df = prepared.non_canceled
     st.subheader("Non-Canceled Orders")
-    st.write(df)
+    charts.paged_table(df, key='non_canceled', token=(data_modified, 'non_canceled'))
     st.write(f"*Number of orders by members: {len(df):,}*")
 
 with cl2:
     st.subheader("Canceled Orders")
-    st.write(canceled_products)
+    charts.paged_table(canceled_products, key='canceled', token=(data_modified, 'canceled'))
     st.write(f"Number of products that were canceled: {len(canceled_products)}")
 
 #--------------------------------------------------------------------------------------------------------------------------
 
 # Customer Invoice Summary
 st.subheader("Customer Invoice Summary")
-df_productCount = df.groupby(by=['InvoiceNo', 'CustomerID'], as_index=False).agg({'InvoiceDate': 'count','Quantity': 'sum'})
-df_productCount = df_productCount.rename(columns={'InvoiceDate': 'List Product per Invoice','Quantity': 'Total Quantity Product'})
-
-df_productCount['order_canceled'] = df_productCount['InvoiceNo'].apply(lambda x:int('C' in x))
+invoices = prepared.invoices[~prepared.invoices['Canceled']].sort_values(['InvoiceNo', 'CustomerID'], kind='stable')
+df_productCount = invoices[['InvoiceNo', 'CustomerID', 'Lines', 'Quantity', 'Canceled']].reset_index(drop=True)
+df_productCount = df_productCount.rename(columns={'Lines': 'List Product per Invoice','Quantity': 'Total Quantity Product','Canceled': 'order_canceled'})
+df_productCount['order_canceled'] = df_productCount['order_canceled'].astype(int)
 
 n1 = df_productCount['order_canceled'].sum()
 n2 = df_productCount.shape[0]
-st.dataframe(df_productCount , width = 1000)
+charts.paged_table(df_productCount, key='invoice_summary', token=(data_modified, 'invoice_summary'))
 
 #--------------------------------------------------------------------------------------------------------------------------
 
@@ -168,22 +186,16 @@ st.dataframe(df_productCount , width = 1000)
 st.header("Choose your filter: ")
 
 # Create for Country
-country = st.multiselect("Pick your Country", df["Country"].unique())
-if not country:
-    filtered_df = df.copy()
-else:
-    filtered_df = df[df["Country"].isin(country)]
+country = st.multiselect("Pick your Country", sales_cube.countries)
 
 #--------------------------------------------------------------------------------------------------------------------------
  
 # Start Date & End Date
 
 col1, col2 = st.columns((2))
-df["InvoiceDate"] = pd.to_datetime(df["InvoiceDate"])
 
 # Getting the min and max date
-startDate = pd.to_datetime(df["InvoiceDate"]).min()
-endDate = pd.to_datetime(df["InvoiceDate"]).max()
+startDate, endDate = sales_cube.date_range()
 
 with col1:
     date1 = pd.to_datetime(st.date_input("Start Date", startDate))
@@ -191,90 +203,74 @@ with col1:
 with col2:
     date2 = pd.to_datetime(st.date_input("End Date", endDate))
 
-df = df[(df["InvoiceDate"] >= date1) & (df["InvoiceDate"] <= date2)].copy()
+# Both filters together slice the sales cube, not the rows: the end date is included in full
+selection = dict(countries=country, start=date1, end=calendar_features.day_end(date2))
 
 #--------------------------------------------------------------------------------------------------------------------------
 
-filtered_df['TotalSales'] = df['Quantity'] * df['UnitPrice']
-
 # Country wise Sales
-      
 st.subheader("Country wise Sales")
 cl1, cl2 = st.columns(2)
 with cl1:
-    fig_pie = px.pie(filtered_df, values = filtered_df['TotalSales'] , names = "Country")
-    fig_pie.update_traces(text = filtered_df["Country"] , textposition = "inside")
+    country_sales = chart_data.rollup(sales_cube, COUNTRY_SALES, 'Country wise Sales', **selection)
+    payloads.append(country_sales.stats)
+    fig_pie = px.pie(country_sales.frame, values = 'Total Sales' , names = "Country")
+    fig_pie.update_traces(text = country_sales.frame["Country"] , textposition = "inside")
     st.plotly_chart(fig_pie , use_container_width = True , height = 650)
 
 with cl2:
     with st.expander("Country_wise_Sales ViewData"):
-            country = filtered_df.groupby(by = "Country" , as_index = False)['TotalSales'].sum()
+            country = sales_cube.query(['Country'], **selection)[['Country', 'TotalSales']]
             st.write(country.style.background_gradient(cmap = "Oranges"))
-            csv = country.to_csv(index = False).encode('utf-8')
-            st.download_button("Download Data" , data = csv , file_name = "Country_wise_Sales.csv" , mime = "text/csv",
-                                help = 'Click here to download the data as a CSV file')
+            charts.export_button(country, "data", "Country_wise_Sales", key='country_export', index=False)
 
 #--------------------------------------------------------------------------------------------------------------------------
 
-filtered_df['InvoiceDate'] = pd.to_datetime(df['InvoiceDate'])
-filtered_df['Date'] = filtered_df['InvoiceDate'].dt.strftime("%Y-%m-%d")
-filtered_df['Month'] = filtered_df['InvoiceDate'].dt.to_period('M').astype(str)
-
 # Calculate total daily sales
-daily_sales = filtered_df.groupby('Date', as_index=False)['TotalSales'].sum()
+daily_sales = chart_data.summarize(sales_cube, summaries.daily_sales, 'Daily Total Sales', ['Day', 'TotalSales'], **selection)
 
 # Calculate monthly total sales
-monthly_sales = filtered_df.groupby('Month', as_index=False)['TotalSales'].sum()
+monthly_sales = chart_data.summarize(sales_cube, summaries.monthly_sales, 'Monthly Total Sales', ['Month', 'TotalSales'], **selection)
+
+# Payloads before downsampling; the lines show at most their point budget
+payloads += [daily_sales.stats, monthly_sales.stats]
+daily_sales, monthly_sales = daily_sales.frame, monthly_sales.frame
 
 cl1 , cl2 = st.columns(2)
 with cl1:
     st.subheader("Daily Total Sales")
 
     # graph
-    fig_line1 = px.line(daily_sales, x='Date', y='TotalSales', title='Daily Total Sales',
-                        labels={"TotalSales": "Amount"}, height=500, width=1000,
-                        template="gridon")
-    st.plotly_chart(fig_line1, use_container_width=True)
+    charts.zoomable_line(daily_sales, 'Date', 'TotalSales', 'Daily Total Sales', key='daily_sales',
+                         labels={"TotalSales": "Amount"}, height=500, width=1000,
+                         template="gridon")
 
     # download_button
     with st.expander("View Data of Daily Total Sales:"):
         st.write(daily_sales.T.style.background_gradient(cmap = "Blues"))
-        csv = daily_sales.to_csv(index = False).encode("utf-8")
-        st.download_button('Download Data' , data = csv , file_name = "Daily_TotalSales.csv" , mime = 'text/csv')
+        charts.export_button(daily_sales, "data", "Daily_TotalSales", key='daily_export', index=False)
 
 with cl2:
     st.subheader("Monthly Total Sales")
     
     # graph
-    fig_line2 = px.line(monthly_sales, x='Month', y='TotalSales', title='Monthly Total Sales',
-                        labels={"TotalSales": "Amount"}, height=500, width=1000,
-                        template="gridon")
-    st.plotly_chart(fig_line2, use_container_width=True)
+    charts.zoomable_line(monthly_sales, 'Month', 'TotalSales', 'Monthly Total Sales', key='monthly_sales',
+                         labels={"TotalSales": "Amount"}, height=500, width=1000,
+                         template="gridon")
     
     # download_button
     with st.expander("View Data of Monthly Total Sales:"):
         st.write(monthly_sales.T.style.background_gradient(cmap = "Blues"))
-        csv = monthly_sales.to_csv(index = False).encode("utf-8")
-        st.download_button('Download Data' , data = csv , file_name = "Monthly_TotalSales.csv" , mime = 'text/csv')
+        charts.export_button(monthly_sales, "data", "Monthly_TotalSales", key='monthly_export', index=False)
     
 #--------------------------------------------------------------------------------------------------------------------------
 
 # Sales by Time Period
 
-# Create a function to find a time period
-def time_of_day(hour):
-    if 6 <= hour < 12:
-        return 'Morning'
-    elif 12 <= hour < 18:
-        return 'Afternoon'
-    elif 18 <= hour < 24:
-        return 'Evening'
-    else:
-        return 'Night'
-
 # Calculate total sales by time period
-filtered_df['TimePeriod'] = filtered_df['InvoiceDate'].dt.hour.apply(time_of_day)
-time_period_sales = filtered_df.groupby('TimePeriod' , as_index=False)['TotalSales'].sum()
+time_period_sales = chart_data.summarize(sales_cube, summaries.time_period_sales, 'Sales by Time Period', ['Hour', 'TotalSales'], **selection)
+payloads.append(time_period_sales.stats)
+time_period_sales = time_period_sales.frame
 
 st.subheader("Sales by Time Period")
 
@@ -285,8 +281,7 @@ st.plotly_chart(fig_bar2, use_container_width=True)
 # download_button
 with st.expander("View Data of Sales by Time Period:"):
         st.write(time_period_sales.T.style.background_gradient(cmap = "Blues"))
-        csv = time_period_sales.to_csv(index = False).encode("utf-8")
-        st.download_button('Download Data' , data = csv , file_name = "Sales_by_TimePeriod.csv" , mime = 'text/csv')
+        charts.export_button(time_period_sales, "data", "Sales_by_TimePeriod", key='time_period_export', index=False)
 
 #--------------------------------------------------------------------------------------------------------------------------
 
@@ -294,55 +289,62 @@ with st.expander("View Data of Sales by Time Period:"):
 
 st.subheader("Product Sales Summary")
 
-filtered_df_product = filtered_df.groupby(by=['StockCode','Description'], as_index=False).agg({'Quantity': 'sum','TotalSales': 'sum','StockCode' : 'count'})
-filtered_df_product = filtered_df_product.rename(columns = {'Quantity': 'Total Quantity','TotalSales': 'TotalSales per Procuct','StockCode' : 'Total orders per product'})
+product_sales = chart_data.rollup(sales_cube, PRODUCT_SALES, 'Product Sales Summary', **selection)
+filtered_df_product = product_sales.frame
 
-st.dataframe(filtered_df_product, width=1000)
+charts.paged_table(filtered_df_product, key='product_summary')
 
 # download_button
 with st.expander("View Data of Product Sales Summary:"):
         st.write(filtered_df_product.style.background_gradient(cmap = "Oranges"))
-        csv = filtered_df_product.to_csv(index = False).encode("utf-8")
-        st.download_button('Download Data' , data = csv , file_name = "ProductSales_Summary.csv" , mime = 'text/csv')
+        charts.export_button(filtered_df_product, "data", "ProductSales_Summary", key='product_export', index=False)
 
 
 # Top 5
+# All three rankings, selected in one pass over the product aggregate
+top_5 = chart_data.leaders(product_sales, 5, ['Total Quantity', 'TotalSales per Procuct', 'Total orders per product'],
+                          ['Top 5 Products by Total Quantity', 'Top 5 Products by TotalSales per Procuct', 'Top 5 Products by Total orders per product'])
 
 # : Total Quantity
 # Select the top 5
-top_5_products = filtered_df_product.nlargest(5, 'Total Quantity')
+top_5_products = top_5[0]
+payloads.append(top_5_products.stats)
 
 # graph
 #st.subheader("Top 5 Products by Total Quantity")
-fig_pie2 = px.pie(top_5_products, values = top_5_products['Total Quantity'] , names = 'Description',
+fig_pie2 = px.pie(top_5_products.frame, values = 'Total Quantity' , names = 'Description',
                   title = "Top 5 Products by Total Quantity")
-fig_pie2.update_traces(text = filtered_df['Description'] , textposition = "outside")
+fig_pie2.update_traces(text = top_5_products.frame['Description'] , textposition = "outside")
 st.plotly_chart(fig_pie2)
 
 
 # : TotalSales
 # Select the top 5
-top_5_products = filtered_df_product.nlargest(5, 'TotalSales per Procuct')
+top_5_products = top_5[1]
+payloads.append(top_5_products.stats)
 
 # graph
 #st.subheader("Top 5 Products by TotalSales per Procuct")
-fig_pie2 = px.pie(top_5_products, values = top_5_products['TotalSales per Procuct'] , names = 'Description',
+fig_pie2 = px.pie(top_5_products.frame, values = 'TotalSales per Procuct' , names = 'Description',
                   title = "Top 5 Products by TotalSales per Procuct")
-fig_pie2.update_traces(text = filtered_df['Description'] , textposition = "outside")
+fig_pie2.update_traces(text = top_5_products.frame['Description'] , textposition = "outside")
 st.plotly_chart(fig_pie2)
 
 
 # : Total orders per product
 # Select the top 5
-top_5_products = filtered_df_product.nlargest(5, 'Total orders per product')
+top_5_products = top_5[2]
+payloads.append(top_5_products.stats)
 
 # graph
 #st.subheader("Top 5 Products by Total orders per product")
-fig_pie2 = px.pie(top_5_products, values = top_5_products['Total orders per product'] , names = 'Description',
+fig_pie2 = px.pie(top_5_products.frame, values = 'Total orders per product' , names = 'Description',
                   title = "Top 5 Products by Total orders per product")
-fig_pie2.update_traces(text = filtered_df['Description'] , textposition = "outside")
+fig_pie2.update_traces(text = top_5_products.frame['Description'] , textposition = "outside")
 st.plotly_chart(fig_pie2)
 
+charts.payload_report(payloads)
+
 #--------------------------------------------------------------------------------------------------------------------------
 
 # End Main page #
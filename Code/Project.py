@@ -1,135 +1,175 @@
+import os
+import sys
 import streamlit as st
-import pandas as pd
-import numpy as np
-import random
-from io import StringIO
-import squarify
 import plotly.graph_objs as go
-import matplotlib.pyplot as plt
 import plotly.express as px
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "Code"))  # helper modules live in Code/
+import calendar_features
+import ingest
+import frame_cache
+import prepare
+import rfm
+import streaming
+import rfm_store
+import parallel
+import charts
+import chart_data
+import cube
+import pipeline
+import summaries
+import backends
+
 ### Page setup ###
 st.set_page_config(page_title="Analysis Dashboard", page_icon=":bar_chart:", layout="wide")
 st.markdown('<style>div.block-container{padding-top:1.5rem;}</style>',unsafe_allow_html=True) #ปรับ top padding
 st.title("Data analysis Dashbord")
 # End Page setup #
 
+### Chart data ###
+# Charts get their aggregate, never the transaction rows
+COUNTRY_SALES = chart_data.ChartSpec(dimensions=('Country',), measures={'Total Sales': ('TotalSales', 'sum')})
+PRODUCT_SALES = chart_data.ChartSpec(dimensions=('StockCode', 'Description'),
+                                     measures={'Total Quantity': ('Quantity', 'sum'),
+                                               'Total Sales per Product': ('TotalSales', 'sum'),
+                                               'Total orders per product': ('StockCode', 'count')})
+# End Chart data #
+
 with st.sidebar:
+    # Stage cache shared by every rerun and session of this server process #
+    @st.cache_resource
+    def get_pipeline():
+            return pipeline.Pipeline()
+    stages = get_pipeline()
+
     # Upload file #
-    @st.cache_data
+    def upload_key(file):
+            # The content hash roots every stage key; computed once per upload, not per rerun
+            keys = st.session_state.setdefault('upload_keys', {})
+            if file.file_id not in keys:
+                keys[file.file_id] = frame_cache.content_key(file.getvalue(), file.name, ingest.schema_for(file.name))
+            return keys[file.file_id]
+
+    def load_node(file):
+            # Parsed once per distinct upload; later loads (even after a restart) memory-map the Arrow cache
+            return stages.source('load', upload_key(file),
+                                 lambda: frame_cache.read_csv(file.getvalue(), file.name, schema=ingest.schema_for(file.name),
+                                                              chunksize=read_chunksize, trace_memory=trace_memory))
+
     def load_data(file):
-            data = pd.read_csv(file)
+            data, _ = load_node(file).value
             return data
 
+    # The loaded frame alone, for stages that take the upload as it is (e.g. Data_sample.csv)
+    def sample_node(file):
+            return stages.stage('sample', lambda loaded: loaded[0], load_node(file))
+
+    # Shared, read-only prepared frame: built once per upload and reused by every section
+    def prepare_node(file):
+            return stages.stage('prepare', lambda loaded: prepare.prepare_transactions(loaded[0]), load_node(file))
+
+    # Sales cube over the prepared frame: every time / country / product chart is a roll-up of it
+    def cube_node(file):
+            return stages.stage('cube', cube.SalesCube.from_prepared, prepare_node(file))
+
+    # Summary and RFM queries run on this deployment's backend (RETAIL_BACKEND): pandas
+    # answers them from the shared stages above, other backends query the upload themselves
+    def backend_node(file):
+            return stages.stage('backend', lambda loaded, backend, workers: backends.open_backend(loaded[0], backend, workers=workers),
+                                load_node(file), backend=backends.DEFAULT_BACKEND, workers=agg_workers)
+
+    def summary_node(file, name, pandas_func, *input_nodes):
+            # name is both the stage and the backend method; input_nodes are node builders
+            # (load_node, prepare_node, ...), only built on pandas deployments
+            if backends.DEFAULT_BACKEND == 'pandas':
+                return stages.stage(name, pandas_func, *[node(file) for node in input_nodes])
+            return stages.stage(name, lambda backend: getattr(backend, name)(), backend_node(file))
+
     uploaded_file = st.file_uploader("Choose a file")
+    read_chunksize = st.number_input("Read chunk size (rows, 0 = whole file)", min_value=0, value=0, step=100_000) or None
+    trace_memory = st.checkbox("Trace peak memory while loading")
+    agg_workers = st.number_input("Aggregation workers", min_value=1, max_value=os.cpu_count() or 1,
+                                  value=min(parallel.DEFAULT_WORKERS, os.cpu_count() or 1))
+    out_of_core = st.checkbox("Out-of-core RFM (stream the CSV in chunks)")
+    if out_of_core:
+        memory_limit_gb = st.number_input("RFM memory limit (GB)", min_value=0.25, value=2.0, step=0.25)
+        quantile_error = st.number_input("Clipping quantile error (0 = exact)", min_value=0.0, max_value=0.01, value=0.0, step=0.0005, format="%.4f")
+    use_rfm_store = st.checkbox("Incremental RFM store (daily deltas)")
+    if use_rfm_store:
+        delta_file = st.file_uploader("New transactions (delta CSV)", key="delta_file")
+        apply_delta = st.button("Apply delta")
+    if uploaded_file is not None and not out_of_core:
+        # Out of core the upload is only ever streamed, so it is never loaded for this caption
+        st.caption(f"Load: {load_node(uploaded_file).value[1]}")
 
     # Cleansing Data #
+    # Returns the stage node of the RFM table (or of the uploaded frame for other files)
     def CleansingData(uploaded_file):
+            if uploaded_file.name == 'OnlineRetail.csv' and out_of_core:
+                return stages.stage('rfm', lambda upload, **params: streaming.stream_rfm(uploaded_file, chunksize=read_chunksize, **params),
+                                    upload=upload_key(uploaded_file), memory_limit=int(memory_limit_gb * 2**30),
+                                    quantile_error=quantile_error or None)
+            if uploaded_file.name == 'OnlineRetail.csv' and use_rfm_store:
+                # Keyed on the upload and the store's last save, so a new upload or an applied delta invalidates the table
+                return stages.stage('rfm', lambda **params: open_rfm_store(uploaded_file).rfm_table(),
+                                    upload=upload_key(uploaded_file), store=rfm_store.STORE_DIR, saved=rfm_store_version())
+            if uploaded_file.name == 'OnlineRetail.csv' and backends.DEFAULT_BACKEND != 'pandas':
+                return stages.stage('rfm', lambda backend: backend.rfm_table(), backend_node(uploaded_file))
             if uploaded_file.name == 'OnlineRetail.csv':
-                df = load_data(uploaded_file)
-                df = df[df['CustomerID'].notnull()]
-
-                for col in ['Quantity', 'UnitPrice']:
-                    series = sorted(df[col])
-                    Q1, Q3 = np.quantile(series, [0.01, 0.99])
-                    IQR = Q3 - Q1
-                    lowerLimit = Q1 - (1.5 * IQR)
-                    upperLimit = Q3 + (1.5 * IQR)
-                    df[col] = np.where(df[col] < lowerLimit, lowerLimit, df[col])
-                    df[col] = np.where(df[col] > upperLimit, upperLimit, df[col])
-                
-                df['InvoiceDate'] = pd.to_datetime(df['InvoiceDate']) 
-                fixDate = np.max(df['InvoiceDate'])
-
-                df = df.eval("TotalPrice = Quantity * UnitPrice")
-
-                Data_clean = df.groupby(['CustomerID']).agg(
-                    {
-                        'InvoiceDate': lambda date: (fixDate - date.max()).days,
-                        'InvoiceNo': lambda num: num.nunique(),
-                        'TotalPrice': lambda price: price.sum()
-                    }
-                )
-                Data_clean.columns = ['recency', 'frequency', 'monetary']
-                return Data_clean
+                cleansed = stages.stage('cleanse', lambda loaded: summaries.cleanse_for_rfm(loaded[0]), load_node(uploaded_file))
+                # Recency and frequency come from the invoice headers of the prepared data
+                return stages.stage('rfm', lambda df, prepared: rfm.rfm_table(df, workers=agg_workers, invoices=prepared.invoices),
+                                    cleansed, prepare_node(uploaded_file))
             else:
-                df = load_data(uploaded_file)
-                return df
+                return sample_node(uploaded_file)
     
+    # Incremental RFM store #
+    def open_rfm_store(uploaded_file):
+            # The store belongs to the history it was built from; another upload rebuilds it
+            if rfm_store.RFMStore.exists():
+                store = rfm_store.RFMStore.open()
+                if store.source == upload_key(uploaded_file):
+                    return store
+            return rfm_store.RFMStore.build(load_data(uploaded_file), source=upload_key(uploaded_file))
+
+    def rfm_store_version():
+            meta = os.path.join(rfm_store.STORE_DIR, 'meta.json')
+            return os.path.getmtime(meta) if os.path.exists(meta) else None
+
+    if use_rfm_store and apply_delta:
+        if uploaded_file is None or delta_file is None:
+            st.info("Upload both the history file and a delta file")
+        else:
+            store = open_rfm_store(uploaded_file)
+            delta, delta_stats = ingest.read_csv(delta_file, schema=ingest.ONLINE_RETAIL_SCHEMA)
+            updated = store.apply_delta(delta)
+            store.save()
+            st.success(f"Updated {updated:,} customers from {delta_stats.rows:,} rows")
+
     submit = st.button("SUBMIT", type="primary")
 # End Sidebar #
 
 
-### Definition Convert RFM Score to segment label ###
-def segment_label(RFMScore):
-    if RFMScore in ['54', '55']:
-        return "Champion"
-    elif RFMScore == '52':
-        return "Recent User"
-    elif RFMScore == '51':
-        return "Price Sensitive"
-    elif RFMScore in ['42', '43', '52', '53']:
-        return "Potential Loyalist"
-    elif RFMScore == '41':
-        return "Promising"
-    elif RFMScore in ['34', '35', '44', '45']:
-        return "Loyal Customer"
-    elif RFMScore == '33':
-        return "Needs Attention"
-    elif RFMScore in ['31', '32']:
-        return "About to Sleep"
-    elif RFMScore in ['15', '25']:
-        return "Can't Lose Them"
-    elif RFMScore in ['13', '14', '23', '24']:
-        return "Hibernating"
-    elif RFMScore in ['11', '12', '21', '22']:
-        return "Lost"
-    else:
-        return "Don't have segment label"
-# End def #
-    
 ### Definition create RFM model ###    
-def RFMmodel(df):
-    RFM_data = pd.concat([df['recency'], df['frequency'],df['monetary']], axis=1)
-    RFM_data['RecencyScore'] = pd.qcut(RFM_data['recency'], 5, labels=[5, 4, 3, 2, 1])
-    RFM_data['FrequencyScore'] = pd.qcut(RFM_data['frequency'].rank(method = 'first'),5, labels = [1, 2, 3, 4, 5])
-    RFM_data['MonetaryScore'] = pd.qcut(RFM_data['monetary'], 5, labels = [1, 2, 3, 4, 5])
-    RFM_data['FMScore'] = (RFM_data['FrequencyScore'].astype('float') + RFM_data['MonetaryScore'].astype('float'))/2
-    RFM_data['FMScore'] = np.ceil(RFM_data['FMScore']).astype('int')
-    RFM_data['RFMScore'] = RFM_data['RecencyScore'].astype('str') + RFM_data['FMScore'].astype('str') 
-
-    RFM_data['Segment'] = RFM_data['RFMScore'].apply(segment_label)
+def RFMmodel(node):
+    # node: stage node holding the RFM table
+    RFM_data = stages.stage('segment', rfm.rfm_scores, node)
 
     # Calculate average values for each RFM_Segment_Label
-    segment_summary = RFM_data.groupby('Segment').agg(
-        Recency_Avg=('recency', 'mean'),
-        Frequency_Avg=('frequency', 'mean'),
-        Monetary_Avg=('monetary', 'mean'),
-        Segment_Size=('Segment', 'count')
-    ).reset_index()
+    segment_summary = stages.stage('segment_summary', rfm.segment_summary, RFM_data).value
     
-    result = RFM_data.groupby(['Segment'])['Segment'].count()
-    values = list(result)
-    labels = result.index
-    total_customers = len(RFM_data)
-    labels_with_percentage = [f"{label} ({value / total_customers * 100:.2f}%)" for label, value in zip(labels, values)]
-
-    # Plot model
-    colors = ['#070F2B', '#1B1A55', '#535C91', '#9290C3']
-    plt.figure(figsize = (18, 11), facecolor='none')  
-    squarify.plot(sizes=values, color=colors, label=labels_with_percentage ,text_kwargs={'color': 'white', 'fontsize': 12})
-    plt.title('Customer segmentation',fontsize=16)
-    plt.xlabel('Recency',color='white', fontsize=16)
-    plt.ylabel('FMScore',color='white', fontsize=16)
-    plt.tick_params(axis='x', colors='white', labelsize=14)  
-    plt.tick_params(axis='y', colors='white', labelsize=14)  
-    st.pyplot(plt)
+    # Plot model (cached on the segment counts, so an unchanged segmentation is not redrawn)
+    segment_counts = stages.stage('segment_counts', rfm.segment_counts, RFM_data).value
+    charts.segment_treemap(segment_counts, len(RFM_data.value))
 
     return segment_summary
 # End def #
 
 ### Definition plot metric ###
-def plot_metric(label, value=0.00, prefix="", suffix="", show_graph=False, color_graph=""):
+# Sparklines show the last SPARKLINE_DAYS calendar days of the daily rollup
+SPARKLINE_DAYS = 30
+
+def plot_metric(label, value=0.00, prefix="", suffix="", show_graph=False, color_graph="", series=None):
     fig = go.Figure()
 
     fig.add_trace(
@@ -148,10 +188,10 @@ def plot_metric(label, value=0.00, prefix="", suffix="", show_graph=False, color
         )
     )
 
-    if show_graph:
+    if show_graph and series is not None:
         fig.add_trace(
             go.Scatter(
-                y=random.sample(range(0, 101), 30),
+                y=series,
                 hoverinfo="skip",
                 fill="tozeroy",
                 fillcolor=color_graph,
@@ -190,231 +230,211 @@ def bar_chart(df, x, y, lable, title):
     st.plotly_chart(fig, use_container_width=True) 
 # End def #
 
-### Main layout ###
-if submit:
-    if uploaded_file is None:
-        st.info("Upload a file through config")
-        st.stop()
-
-    if uploaded_file is not None:
-        # To read file as bytes:
-        bytes_data = uploaded_file.getvalue()
+### Definition Dashbord view ###
+# Each view is a fragment: it is only computed while it is selected, and widgets inside
+# it (zoom sliders, table pages) rerun that view alone. Both views pull their data from
+# the same pipeline stages, so nothing is computed twice.
+@st.fragment
+def dashboard_view(uploaded_file):
+    RFMmodel(CleansingData(uploaded_file))
+
+    if out_of_core:
+        st.info("The sales charts need the whole file in memory; untick Out-of-core RFM to show them")
+    elif uploaded_file.name == 'OnlineRetail.csv':
+        prepared_node = prepare_node(uploaded_file)
+        prepared = prepared_node.value
+        sales_cube = cube_node(uploaded_file)
+        df = prepared.frame
+        max_year = prepared.max_year
+        # KPI cards read the per-day rollup (built once per upload), not the rows
+        daily = prepared.daily
+        in_max_year = calendar_features.day_years(daily.index) == max_year
+        trailing = daily.iloc[-SPARKLINE_DAYS:]
+
+        canceled_products = prepared.canceled
+
+        c1, c2, c3 = st.columns(3)
+
+        with c1:
+            plot_metric(
+                f"Total sales {max_year}",
+                daily.loc[in_max_year, 'sales'].sum(),
+                prefix="$",
+                suffix="",
+                show_graph=True,
+                color_graph="rgba(0, 104, 201, 0.2)",
+                series=trailing['sales'].to_numpy()
+            )
+        with c2:
+            plot_metric(f"Total called products {max_year}", 
+                        daily.loc[in_max_year, 'canceled_sales'].sum()*(-1),
+                        prefix="$", suffix="", show_graph=True ,color_graph="rgba(0, 104, 201, 0.2)",
+                        series=trailing['canceled_sales'].to_numpy()*(-1))
+
+        with c3:
+            plot_metric("Total number of members", 
+                        int(daily['members'].iloc[-1]),
+                        prefix="", suffix="", show_graph=True ,color_graph="rgba(0, 104, 201, 0.2)",
+                        series=trailing['members'].to_numpy())
+            
+        payloads = []
+
+        # Graph comparing total sales vs canceled sales
+        sales_comparison = summary_node(uploaded_file, 'sales_comparison', summaries.sales_comparison, prepare_node).value
+        payloads.append(chart_data.cube_stats(sales_cube.value, 'Comparison of Total Sales', ['InvoiceNo', 'TotalSales'],
+                                              sales_cube.value.n_rows, sales_comparison))
+        fig_bar1 = px.bar(sales_comparison, x='Status',y='Total Sales',text='Total Sales',
+                        title="Comparison of Total Sales: Non-Canceled vs Canceled Orders",
+                        color='Status',
+                        color_discrete_map={'Non-Canceled': 'green', 'Canceled': 'red'}
+        )
+        st.plotly_chart(fig_bar1, use_container_width=True)
+
+        cl1 , cl2 = st.columns(2)
+        with cl1:
+            df = prepared.non_canceled
+            with st.expander("Non-Canceled Orders"):
+                st.write(f"*Number of orders by members: {len(df):,}*")
+                charts.paged_table(df, key='non_canceled', token=(uploaded_file.file_id, 'non_canceled'))
+
+        with cl2:
+            with st.expander("Canceled Orders"):
+                st.write(f"Number of products that were canceled: {len(canceled_products):,}")
+                charts.paged_table(canceled_products, key='canceled', token=(uploaded_file.file_id, 'canceled'))
+
+
+        # Calculate total daily sales
+        daily_sales = stages.stage('daily_sales', lambda c: chart_data.summarize(c, summaries.daily_sales, 'Daily Sales', ['Day', 'TotalSales']),
+                                   sales_cube).value
+
+        # Calculate monthly total sales
+        monthly_sales = stages.stage('monthly_sales', lambda c: chart_data.summarize(c, summaries.monthly_sales, 'Monthly Sales', ['Month', 'TotalSales']),
+                                     sales_cube).value
+
+        a1, a2 = st.columns(2)
+        with a1:
+            orders = stages.stage('orders_per_country', lambda c: chart_data.summarize(c, summaries.orders_per_country, 'Number of Orders per Country',
+                                                                                      ['Country', 'InvoiceNo']), sales_cube).value
+            payloads.append(orders.stats)
+            countries = orders.frame
+
+            # Define the data for the choropleth map
+            data = dict(
+                type='choropleth',
+                locations=countries.index,
+                locationmode='country names',
+                z=countries,
+                text=countries.index,
+                colorbar={'title': 'Order nb.'},
+                colorscale=[
+                        [0, 'rgb(230,230,250)'],
+                        [0.01, 'rgb(166,206,227)'],
+                        [0.02, 'rgb(31,120,180)'],
+                        [0.03, 'rgb(178,223,138)'],
+                        [0.05, 'rgb(51,160,44)'],
+                        [0.10, 'rgb(251,154,153)'],
+                        [0.20, 'rgb(255,255,0)'],
+                        [1, 'rgb(227,26,28)']
+                ],
+                reversescale=False
+            )
         
-        # To convert to a string based IO:
-        stringio = StringIO(uploaded_file.getvalue().decode("utf-8"))
-
-        df = load_data(uploaded_file)
-
-    if uploaded_file.name == 'Data_sample.csv':
-        RFMmodel(df)
+            layout = dict(
+                title='Number of Orders per Country',
+                geo=dict(showframe=True, projection={'type': 'mercator'})
+            )
+            choromap = go.Figure(data=[data], layout=layout)
+            st.plotly_chart(choromap)
+
+        # Country with Sales
+        with a2:
+            st.subheader("Country with Sales")
+            country_sales = stages.stage('country_sales', lambda c: chart_data.rollup(c, COUNTRY_SALES, 'Country with Sales'),
+                                         sales_cube).value
+            payloads.append(country_sales.stats)
+            fig_pie = px.pie(country_sales.frame, values = 'Total Sales' , names = "Country")
+            fig_pie.update_traces(text = country_sales.frame["Country"] , textposition = "inside")
+            st.plotly_chart(fig_pie , use_container_width = True , height = 650)
+
+        ### Top 5 ###
+        # Select the top 5 of Quantity
+        product_sales = stages.stage('product_sales', lambda c: chart_data.rollup(c, PRODUCT_SALES, 'Product Sales'),
+                                     sales_cube).value
+        # All three rankings, selected in one pass over the product aggregate
+        top_5 = chart_data.leaders(product_sales, 5, ['Total Quantity', 'Total Sales per Product', 'Total orders per product'],
+                                  ['Top 5 Products by Total Quantity', 'Top 5 Products by Total Sales per Product', 'Top 5 Products by Total Orders per Product'])
+        top_5_products = top_5[0]
+        payloads.append(top_5_products.stats)
+
+        # graph
+        fig_pie2 = px.pie(top_5_products.frame, values = 'Total Quantity' , names = 'Description',
+                        title = "Top 5 Products by Total Quantity")
+        fig_pie2.update_traces(text = top_5_products.frame['Description'] , textposition = "outside")
+        st.plotly_chart(fig_pie2)
+    
+        # Select the top 5 
+        top_5_products = top_5[1]
+        payloads.append(top_5_products.stats)
+
+        # graph
+        fig_pie2 = px.pie(top_5_products.frame, values = 'Total Sales per Product' , names = 'Description',
+                        title = "Top 5 Products by Total Sales per Product",template="gridon")
+        fig_pie2.update_traces(text = top_5_products.frame['Description'] , textposition = "outside")
+        st.plotly_chart(fig_pie2)
+
+        # Select the top 5
+        top_5_products = top_5[2]
+        payloads.append(top_5_products.stats)
+
+        # graph
+        fig_pie2 = px.pie(top_5_products.frame, values = 'Total orders per product' , names = 'Description',
+                        title = "Top 5 Products by Total Orders per Product", template='plotly_dark')
+        fig_pie2.update_traces(text = top_5_products.frame['Description'] , textposition = "outside")
+        st.plotly_chart(fig_pie2)
+        # End Top 5 #
+
+        b1, b2 = st.columns(2)
+
+        # Weekly Sales
+        with b1:
+            sales_by_day = stages.stage('weekday_sales', lambda c: chart_data.summarize(c, summaries.weekday_sales, 'Weekly Sales by Invoice Date',
+                                                                                        ['Weekday', 'TotalSales']), sales_cube).value
+            payloads.append(sales_by_day.stats)
+
+            bar_chart(sales_by_day.frame, 'Day of Week', 'Total Sales', 'Day of Week', 'Weekly Sales by Invoice Date')
+
+        # Sales by Time Period
+        with b2:
+            # Calculate total sales by time period
+            time_period_sales = stages.stage('time_period_sales', lambda c: chart_data.summarize(c, summaries.time_period_sales, 'Sales by Time Period',
+                                                                                                 ['Hour', 'TotalSales']), sales_cube).value
+            payloads.append(time_period_sales.stats)
+            fig_bar1 = px.bar(time_period_sales.frame, x='TimePeriod', y='TotalSales', color='TimePeriod', title='Sales by Time Period')
+            st.plotly_chart(fig_bar1, use_container_width=True)
+
+        cl1 , cl2 = st.columns(2)
+
+        # Daily and monthly sales (payloads before downsampling; the line shows at most its point budget)
+        payloads += [daily_sales.stats, monthly_sales.stats]
+        with cl1:
+            charts.zoomable_line(daily_sales.frame, 'Date', 'TotalSales', 'Daily Sales', key='daily_sales',
+                                 labels={"TotalSales": "Amount"}, height=500, width=1000,
+                                 template="gridon")
+        
+        # Monthly Sales
+        with cl2:
+            charts.zoomable_line(monthly_sales.frame, 'Month', 'TotalSales', 'Monthly Sales', key='monthly_sales',
+                                 labels={"TotalSales": "Amount"}, height=500, width=1000,
+                                 template="gridon")
 
-    if uploaded_file.name == 'OnlineRetail.csv':
-        tab1, tab2 = st.tabs(['Dashbord', 'Summarizing'])
-    ### Dashbord ###        
-        with tab1:
-            cleaned_data = CleansingData(uploaded_file)
-            RFMmodel(cleaned_data)
+        charts.payload_report(payloads)
+# End def #
 
-            if uploaded_file.name == 'OnlineRetail.csv':
-                df = df.dropna()
-                df = df.drop_duplicates()
-
-                df['InvoiceDate'] = pd.to_datetime(df['InvoiceDate'])
-                max_year = max(df['InvoiceDate'].dt.year.unique())
-
-                df['TotalSales'] = df['Quantity'] * df['UnitPrice']
-                canceled_products = df[df['InvoiceNo'].str.contains('C', na=False)]
-
-                c1, c2, c3 = st.columns(3)
-
-                with c1:
-                    plot_metric(
-                        f"Total sales {max_year}",
-                        df[df['InvoiceDate'].dt.year == max_year]['TotalSales'].sum(),
-                        prefix="$",
-                        suffix="",
-                        show_graph=True,
-                        color_graph="rgba(0, 104, 201, 0.2)"
-                    )
-                with c2:
-                    plot_metric(f"Total called products {max_year}", 
-                                df[(df['InvoiceDate'].dt.year == max_year) & (df['InvoiceNo'].str.contains('C', na=False))]['TotalSales'].sum()*(-1),
-                                prefix="$", suffix="", show_graph=True ,color_graph="rgba(0, 104, 201, 0.2)")
-
-                with c3:
-                    plot_metric("Total number of members", 
-                                len(df['CustomerID'].value_counts()),
-                                prefix="", suffix="", show_graph=True ,color_graph="rgba(0, 104, 201, 0.2)")
-                    
-                # Graph comparing total sales vs canceled sales
-                totalSales_canceled = canceled_products['TotalSales'].sum()
-                totalSales_non_canceled = df['TotalSales'].sum()
-
-                # Create DataFrame for Comparing
-                sales_comparison = pd.DataFrame({
-                    'Status': ['Non-Canceled', 'Canceled'],
-                    'Total Sales': [totalSales_non_canceled, totalSales_canceled]
-                })
-                fig_bar1 = px.bar(sales_comparison, x='Status',y='Total Sales',text='Total Sales',
-                                title="Comparison of Total Sales: Non-Canceled vs Canceled Orders",
-                                color='Status',
-                                color_discrete_map={'Non-Canceled': 'green', 'Canceled': 'red'}
-                )
-                st.plotly_chart(fig_bar1, use_container_width=True)
-
-                cl1 , cl2 = st.columns(2)
-                with cl1:
-                    df = df[~df.isin(canceled_products)].dropna()
-                    with st.expander("Non-Canceled Orders"):
-                        st.write(f"*Number of orders by members: {len(df):,}*")
-                        st.write(df)
-
-                with cl2:
-                    with st.expander("Canceled Orders"):
-                        st.write(f"Number of products that were canceled: {len(canceled_products):,}")
-                        st.write(canceled_products)
-
-                
-                filtered_df = df.copy()
-                filtered_df['TotalSales'] = df['Quantity'] * df['UnitPrice']
-                filtered_df['InvoiceDate'] = pd.to_datetime(df['InvoiceDate'])
-                filtered_df['Date'] = filtered_df['InvoiceDate'].dt.strftime("%Y-%m-%d")
-                filtered_df['Month'] = filtered_df['InvoiceDate'].dt.to_period('M').astype(str)
-
-                # Calculate total daily sales
-                daily_sales = filtered_df.groupby('Date', as_index=False)['TotalSales'].sum()
-
-                # Calculate monthly total sales
-                monthly_sales = filtered_df.groupby('Month', as_index=False)['TotalSales'].sum()
-
-                a1, a2 = st.columns(2)
-                with a1:
-                    temp = df[['CustomerID', 'InvoiceNo', 'Country']].groupby(['CustomerID', 'InvoiceNo', 'Country']).count()
-                    temp = temp.reset_index(drop = False)
-                    countries = temp['Country'].value_counts()
-
-                    # Define the data for the choropleth map
-                    data = dict(
-                        type='choropleth',
-                        locations=countries.index,
-                        locationmode='country names',
-                        z=countries,
-                        text=countries.index,
-                        colorbar={'title': 'Order nb.'},
-                        colorscale=[
-                                [0, 'rgb(230,230,250)'],
-                                [0.01, 'rgb(166,206,227)'],
-                                [0.02, 'rgb(31,120,180)'],
-                                [0.03, 'rgb(178,223,138)'],
-                                [0.05, 'rgb(51,160,44)'],
-                                [0.10, 'rgb(251,154,153)'],
-                                [0.20, 'rgb(255,255,0)'],
-                                [1, 'rgb(227,26,28)']
-                        ],
-                        reversescale=False
-                    )
-                
-                    layout = dict(
-                        title='Number of Orders per Country',
-                        geo=dict(showframe=True, projection={'type': 'mercator'})
-                    )
-                    choromap = go.Figure(data=[data], layout=layout)
-                    st.plotly_chart(choromap)
-
-                # Country with Sales
-                with a2:
-                    st.subheader("Country with Sales")
-                    fig_pie = px.pie(filtered_df, values = filtered_df['TotalSales'] , names = "Country")
-                    fig_pie.update_traces(text = filtered_df["Country"] , textposition = "inside")
-                    st.plotly_chart(fig_pie , use_container_width = True , height = 650)
-
-                ### Top 5 ###
-                # Select the top 5 of Quantity
-                filtered_df_product = df.groupby(by=['StockCode', 'Description'], as_index=False).agg({'Quantity': 'sum','TotalSales': 'sum','StockCode' : 'count'})
-                filtered_df_product = filtered_df_product.rename(columns = {'Quantity': 'Total Quantity','TotalSales': 'Total Sales per Product','StockCode' : 'Total orders per product'})
-                top_5_products = filtered_df_product.nlargest(5, 'Total Quantity')
-
-                # graph
-                fig_pie2 = px.pie(top_5_products, values = top_5_products['Total Quantity'] , names = 'Description',
-                                title = "Top 5 Products by Total Quantity")
-                fig_pie2.update_traces(text = filtered_df['Description'] , textposition = "outside")
-                st.plotly_chart(fig_pie2)
-            
-                # Select the top 5 
-                top_5_products = filtered_df_product.nlargest(5, 'Total Sales per Product')
-
-                # graph
-                fig_pie2 = px.pie(top_5_products, values = top_5_products['Total Sales per Product'] , names = 'Description',
-                                title = "Top 5 Products by Total Sales per Product",template="gridon")
-                fig_pie2.update_traces(text = filtered_df['Description'] , textposition = "outside")
-                st.plotly_chart(fig_pie2)
-
-                # Select the top 5
-                top_5_products = filtered_df_product.nlargest(5, 'Total orders per product')
-
-                # graph
-                fig_pie2 = px.pie(top_5_products, values = top_5_products['Total orders per product'] , names = 'Description',
-                                title = "Top 5 Products by Total Orders per Product", template='plotly_dark')
-                fig_pie2.update_traces(text = filtered_df['Description'] , textposition = "outside")
-                st.plotly_chart(fig_pie2)
-                # End Top 5 #
-
-                b1, b2 = st.columns(2)
-
-                # Weekly Sales
-                with b1:
-                    df['InvoiceDate'] = pd.to_datetime(df['InvoiceDate'])
-                    df['DayOfWeek'] = df['InvoiceDate'].dt.day_name()
-                    df['TotalSales'] = df['Quantity'] * df['UnitPrice']
-
-                    sales_by_day = df.groupby(['DayOfWeek'])['TotalSales'].sum()
-                    days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-                    sales_by_day = sales_by_day.reindex(days)
-                    sales_by_day = sales_by_day.reset_index()
-                    sales_by_day.columns = ['Day of Week', 'Total Sales']
-
-                    bar_chart(sales_by_day, 'Day of Week', 'Total Sales', 'Day of Week', 'Weekly Sales by Invoice Date')
-
-                # Sales by Time Period
-                with b2:
-                    # Create a function to find a time period
-                    def time_of_day(hour):
-                        if 6 <= hour < 12:
-                            return 'Morning'
-                        elif 12 <= hour < 18:
-                            return 'Afternoon'
-                        elif 18 <= hour < 24:
-                            return 'Evening'
-                        else:
-                            return 'Night'
-
-                    # Calculate total sales by time period
-                    filtered_df['TimePeriod'] = filtered_df['InvoiceDate'].dt.hour.apply(time_of_day)
-                    time_period_sales = filtered_df.groupby('TimePeriod' , as_index=False)['TotalSales'].sum()
-                    fig_bar1 = px.bar(time_period_sales, x='TimePeriod', y='TotalSales', color='TimePeriod', title='Sales by Time Period')
-                    st.plotly_chart(fig_bar1, use_container_width=True)
-
-                cl1 , cl2 = st.columns(2)
-
-                # Daily Sales
-                with cl1:
-                    fig_line1 = px.line(daily_sales, x='Date', y='TotalSales', title='Daily Sales',
-                                        labels={"TotalSales": "Amount"}, height=500, width=1000,
-                                        template="gridon")
-                    st.plotly_chart(fig_line1, use_container_width=True)
-                
-                # Monthly Sales
-                with cl2:
-                    fig_line2 = px.line(monthly_sales, x='Month', y='TotalSales', title='Monthly Sales',
-                                        labels={"TotalSales": "Amount"}, height=500, width=1000,
-                                        template="gridon")
-                    st.plotly_chart(fig_line2, use_container_width=True) 
-
-### Summarizing the results ###
-        with tab2:
-            with st.expander("Data Preview"):
-                st.markdown(f"Number of data: {len(load_data(uploaded_file)):,}")
-                variables = '''**This dataframe contains 8 variables that correspond to:**  
+### Definition Summarizing view ###
+def data_preview(uploaded_file):
+    with st.expander("Data Preview"):
+        st.markdown(f"Number of data: {len(load_data(uploaded_file)):,}")
+        variables = '''**This dataframe contains 8 variables that correspond to:**  
     **InvoiceNo**: Invoice number. Nominal, a 6-digit integral number uniquely assigned to each transaction. If this code starts with letter 'c', it indicates a cancellation.  
     **StockCode**: Product (item) code. Nominal, a 5-digit integral number uniquely assigned to each distinct product.  
     **Description**: Product (item) name. Nominal.  
@@ -424,30 +444,31 @@ if submit:
     **CustomerID**: Customer number. Nominal, a 5-digit integral number uniquely assigned to each customer.  
     **Country**: Country name. Nominal, the name of the country where each customer resides.
     '''
-                st.markdown(variables)
-                st.dataframe(load_data(uploaded_file))
-
-            cleaned_data = CleansingData(uploaded_file)
-            with st.expander("Data for RFM model"):
-                st.markdown(f"Number of data: {len(cleaned_data):,}")
-                c1, c2 = st.columns(2)
-                with c1:
-                    st.write(cleaned_data)               
-                    csv = cleaned_data.to_csv().encode("utf-8")
-                    st.download_button(
-                        label="Download cleaned data as CSV",
-                        data=csv,
-                        file_name="RFM of Online Retail.csv",
-                        mime="text/csv",
-                    )
-                with c2:
-                    segment_summary = RFMmodel(cleaned_data)
-
-            st.write(segment_summary)
-
-            ### Summarized Results ###
-            with st.expander('Insights of Customer behavior'):  
-                st.markdown('''จะเห็นได้ว่ามีลูกค้าเพียงประมาณ 45% ที่อยู่ในระดับ RFM สูงสุด ร้านค้าจะต้องพยายามรักษาความภักดีนี้ไว้ และต้องกระตุ้นลูกค้าในส่วนที่เหลือให้ได้มากที่สุด
+        st.markdown(variables)
+        charts.paged_table(load_data(uploaded_file), key='raw_preview', token=(uploaded_file.file_id, 'raw'))
+
+@st.fragment
+def summary_view(uploaded_file):
+    # Out of core only the streamed RFM results are shown: the preview and summaries load the file
+    if not out_of_core:
+        data_preview(uploaded_file)
+
+    cleaned_node = CleansingData(uploaded_file)
+    cleaned_data = cleaned_node.value
+    with st.expander("Data for RFM model"):
+        st.markdown(f"Number of data: {len(cleaned_data):,}")
+        c1, c2 = st.columns(2)
+        with c1:
+            st.write(cleaned_data)               
+            charts.export_button(cleaned_data, "cleaned data", "RFM of Online Retail", key='rfm_export', token=cleaned_node.key)
+        with c2:
+            segment_summary = RFMmodel(cleaned_node)
+
+    st.write(segment_summary)
+
+    ### Summarized Results ###
+    with st.expander('Insights of Customer behavior'):  
+        st.markdown('''จะเห็นได้ว่ามีลูกค้าเพียงประมาณ 45% ที่อยู่ในระดับ RFM สูงสุด ร้านค้าจะต้องพยายามรักษาความภักดีนี้ไว้ และต้องกระตุ้นลูกค้าในส่วนที่เหลือให้ได้มากที่สุด
                 ซึ่งลูกค้าส่วนใหญ่จะอยู่ที่ Lost, Loyal Customer, Hibernating และ Champion ตามลำดับ โดยทางเราได้ทำการวิเคราะห์กลยุทธ์ทางตลาด ดังนี้  
                 **Champion** (15.30%): ลูกค้ากลุ่มนี้มีความมั่งคั่งทางการเงินค่อนข้างสูง ค่าใช้จ่ายเฉลี่ยอยู่ที่ 442เหรียญ/ครั้ง คาดว่าส่วนใหญ่เป็นนักธุรกิจและมีความจำเป็นต้องใช้สินค้าของทางร้านบ่อยๆ ทางร้านค้าควรที่จะคอยหมั่นเสนอสิทธิพิเศษให้แก่ลูกค้ากลุ่มนี้ เช่น สิทธิ์ในการสั่งซื้อสินค้าล่วงหน้าและเข้าถึงสินค้าได้ก่อนใคร ส่วนลดสำหรับสมาชิกระดับสูง หรือ กิจกรรมพิเศษ  
                 **Loyal Customer** (20.36%): ขาชอปประจำร้าน เฉลี่ยซื้อครั้งละ 371เหรียญ/ครั้ง ทางร้านค้าควรรักษาการติดต่อระหว่างลูกค้ากลุ่มนี้ไว้ ส่งสิทธิพิเศษ กิจกรรมสะสมแต้มจากยอดสั่งซื้อ หรือ โปรโมชั่นสินค้าที่ลูกค้ากลุ่มนี้ซื้อบ่อยๆ เพื่อกระตุ้นให้พวกเขาใช้จ่ายอยู่เสมอ  
@@ -455,32 +476,48 @@ if submit:
                 **Needs Attention** (4.69%): ลูกค้ากลุ่มนี้ห่างหายจากร้านไปค่อนข้างนาน แต่มีการซื้อเฉลี่ยต่อครั้งค่อนข้างสูง อยู่ที่ประมาณ 300เหรียญ/ครั้ง ทางร้านค้าควรติดต่อสอบถามข้อมูลและหาแนวทางปรับแก้ไขเพื่อให้ลูกค้ากลับมาใช้บริการอีกครั้ง อาจจัดโปรโมชั่นต้อนรับสมาชิกเก่าที่ห่างหายไปนาน หรือ เพิ่มเติมสินค้าให้ตรงกับความต้องการของลูกค้า และอาจจะสร้างการรับรู้ถึง Brands ให้มากยิ่งขึ้น  bbbbbbbb
                 **Hibernating** (15.65%): แม้ว่าลูกค้ากลุ่มนี้จะขาดการสั่งซื้อไปนานแล้ว แต่หากสามารถเชิญชวนกลับมาได้จะช่วยให้ยอดขายเพิ่มขึ้นค่อนข้างสูง เนื่องจากลูกค้ากลุ่มนี้สั่งซื้อแต่ละครั้งประมาณ 428เหรียญ ทางร้านควรติดต่อสอบถามลูกค้าและหาแนวทางแก้ไขเช่นเดียวกับลูกค้ากลุ่ม Needs Attention คอยส่งโปรโมชั่นเกี่ยวกับสินค้าที่ลูกค้าสนใจพร้อมกับบริการส่งฟรีโดยกำหนดระยะเวลาเพื่อกระตุ้นให้ลูกค้าใช้จ่ายทันที และจัดกิจกรรมแจกของรางวัลหรือส่วนลดเพื่อต้อนรับการกลับมา  
                 '''
-                )  
-
-            filter = load_data(uploaded_file)
-            filter = filter.dropna()
-            # Summary Data (Data)
-            df_summary = pd.DataFrame([{'Products': len(filter['StockCode'].value_counts()),  
-            'Canceled_products': len(canceled_products),  
-            'Transactions': len(filter['InvoiceNo'].value_counts()),
-            'Customers': len(filter['CustomerID'].value_counts()),
-            'Countries': len(filter['Country'].value_counts())
-            }], columns = ['Products', 'Canceled_products', 'Transactions', 'Customers', 'Countries'], index = ['Quantity'])
-            st.dataframe(df_summary)
-
-            # Customer Invoice Summary
-            st.subheader("Customer Invoice Summary")
-            df_productCount = df.groupby(by=['CustomerID', 'InvoiceNo'], as_index=False).agg({'InvoiceDate': 'count','Quantity': 'sum'})
-            df_productCount = df_productCount.rename(columns={'InvoiceDate': 'List Product per Invoice','Quantity': 'Total Quantity Product'})
-            df_productCount[:10].sort_values('CustomerID')
-            st.dataframe(df_productCount)
-
-            # Product Sales Summary
-            st.subheader("Product Sales Summary")
-            df_product = df.groupby(by=['StockCode','Description'], as_index=False).agg({'Quantity': 'sum','TotalSales': 'sum','StockCode' : 'count'})
-            df_product = df_product.rename(columns = {'Quantity': 'Total Quantity','TotalSales': 'TotalSales per Product','StockCode' : 'Total orders per product'})
-            st.dataframe(df_product, width=1000)
-
-
-
-                
+        )  
+
+    if out_of_core:
+        st.info("The data, invoice and product summaries need the whole file in memory; untick Out-of-core RFM to show them")
+        return
+
+    # Summary Data (Data)
+    df_summary = summary_node(uploaded_file, 'data_summary', lambda loaded, p: summaries.data_summary(loaded[0], p),
+                              load_node, prepare_node).value
+    st.dataframe(df_summary)
+
+    # Customer Invoice Summary
+    st.subheader("Customer Invoice Summary")
+    df_productCount = summary_node(uploaded_file, 'invoice_summary', summaries.invoice_summary, prepare_node).value
+    charts.paged_table(df_productCount, key='invoice_summary', token=(uploaded_file.file_id, 'invoice_summary'))
+
+    # Product Sales Summary
+    st.subheader("Product Sales Summary")
+    df_product = summary_node(uploaded_file, 'product_summary', summaries.product_summary, cube_node).value
+    charts.paged_table(df_product, key='product_summary', token=(uploaded_file.file_id, 'product_summary'))
+# End def #
+
+### Main layout ###
+# SUBMIT opens the dashboard; it stays open through later widget reruns
+if submit:
+    st.session_state['submitted'] = True
+if st.session_state.get('submitted'):
+    if uploaded_file is None:
+        st.info("Upload a file through config")
+        st.stop()
+
+    if uploaded_file.name == 'Data_sample.csv':
+        RFMmodel(sample_node(uploaded_file))
+
+    if uploaded_file.name == 'OnlineRetail.csv':
+        view = st.radio("View", ['Dashbord', 'Summarizing'], horizontal=True, key='view', label_visibility='collapsed')
+        if view == 'Dashbord':
+            dashboard_view(uploaded_file)
+        else:
+            summary_view(uploaded_file)
+
+### Stage cache report ###
+with st.sidebar:
+    with st.expander("Stage cache"):
+        st.dataframe(stages.stats_table(), use_container_width=True)
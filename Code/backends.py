@@ -0,0 +1,277 @@
+import os
+import threading
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+import clipping
+import cube
+import frame_cache
+import ingest
+import prepare
+import rfm
+import summaries
+
+try:
+    import duckdb
+except ImportError:  # without duckdb only the pandas backend is offered
+    duckdb = None
+
+### Backend settings ###
+# The summary and RFM queries are answered by one of two interchangeable backends:
+#   pandas  the in-memory path the dashboard has always used (prepare / cube / rfm)
+#   duckdb  an embedded DuckDB database that scans the CSV or Parquet file itself,
+#           multi-threaded, spilling to DUCKDB_TEMP_DIR beyond DUCKDB_MEMORY_LIMIT
+# Both return the same frames: rows, order, columns, dtypes and values, except that a
+# floating-point total summed in a different order can differ in its last bits. The
+# deployment picks one with RETAIL_BACKEND.
+DEFAULT_BACKEND = os.environ.get('RETAIL_BACKEND', 'pandas')
+DUCKDB_MEMORY_LIMIT = os.environ.get('RETAIL_DUCKDB_MEMORY_LIMIT')  # e.g. '4GB'; DuckDB's default is 80% of RAM
+DUCKDB_TEMP_DIR = os.environ.get('RETAIL_DUCKDB_TEMP_DIR', os.path.join(frame_cache.CACHE_DIR, 'duckdb'))
+
+def available_backends():
+    return [name for name in BACKENDS if name == 'pandas' or duckdb is not None]
+
+def open_backend(source, name=None, **options):
+    # source: path of a CSV / Parquet file, or an already loaded frame
+    name = name or DEFAULT_BACKEND
+    if name not in available_backends():
+        raise ValueError(f"unsupported backend {name!r}; expected one of {available_backends()}")
+    return BACKENDS[name](source, **options)
+
+def is_parquet(path):
+    return str(path).lower().endswith(('.parquet', '.pq'))
+# End Backend settings #
+
+### Definition pandas backend ###
+# Loads the source into a frame and runs the existing pandas pipeline over it;
+# workers is handed to parallel.groupby_agg.
+class PandasBackend:
+    name = 'pandas'
+
+    def __init__(self, source, schema=ingest.ONLINE_RETAIL_SCHEMA, workers=None):
+        if isinstance(source, pd.DataFrame):
+            self.data = source
+        elif is_parquet(source):
+            self.data = ingest.conform(pd.read_parquet(source, columns=schema.columns), schema)
+        else:
+            self.data, _ = ingest.read_csv(source, schema=schema)
+        self.workers = workers
+
+    @property
+    def rows(self):
+        return len(self.data)
+
+    @cached_property
+    def prepared(self):
+        return prepare.prepare_transactions(self.data)
+
+    @cached_property
+    def sales_cube(self):
+        return cube.SalesCube.from_prepared(self.prepared)
+
+    def rfm_table(self):
+        return rfm.rfm_table(summaries.cleanse_for_rfm(self.data), workers=self.workers, invoices=self.prepared.invoices)
+
+    def data_summary(self):
+        return summaries.data_summary(self.data, self.prepared)
+
+    def invoice_summary(self):
+        return summaries.invoice_summary(self.prepared)
+
+    def product_summary(self):
+        return summaries.product_summary(self.sales_cube)
+
+    def sales_comparison(self):
+        return summaries.sales_comparison(self.prepared)
+# End def #
+
+### Definition DuckDB backend ###
+# The same queries in SQL. A CSV or Parquet source is scanned once into a temporary
+# table `raw`, typed like ingest's schema (Parquet as ingest.conform would cast it); a
+# frame source is queried in place.
+# `prepared` mirrors prepare.prepare_transactions: complete, de-duplicated rows with
+# TotalSales and Canceled. Results are cast to the dtypes the pandas backend returns.
+SQL_TYPES = {'str': 'VARCHAR', 'category': 'VARCHAR', 'int32': 'INTEGER', 'Int32': 'INTEGER',
+             'int64': 'BIGINT', 'Int64': 'BIGINT', 'float32': 'FLOAT', 'float64': 'DOUBLE'}
+# pandas.read_csv's default na_values, so both backends see the same missing values
+CSV_NULLS = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+             '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+
+def _name(col):
+    return '"' + col.replace('"', '""') + '"'
+
+def _literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+def _struct(mapping):
+    return '{' + ', '.join(f"{_literal(key)}: {_literal(value)}" for key, value in mapping.items()) + '}'
+
+def parquet_scan(path, schema):
+    # SELECT over read_parquet with the schema's final column types (see ingest.conform)
+    columns = []
+    for col in schema.columns:
+        sql_type = 'TIMESTAMP' if col in schema.date_columns else SQL_TYPES[str(schema.casts.get(col, schema.read_dtypes[col]))]
+        columns.append(f"CAST({_name(col)} AS {sql_type}) AS {_name(col)}")
+    return f"SELECT {', '.join(columns)} FROM read_parquet({_literal(path)})"
+
+def csv_scan(path, schema):
+    # SELECT over read_csv that yields the columns and types ingest.read_csv(path, schema) does
+    types = {col: 'VARCHAR' if col in schema.date_columns else SQL_TYPES[str(dtype)] for col, dtype in schema.read_dtypes.items()}
+    columns = []
+    for col in schema.columns:
+        if col in schema.date_columns:
+            expr = f"strptime({_name(col)}, {_literal(schema.date_format)})" if schema.date_format else f"CAST({_name(col)} AS TIMESTAMP)"
+        elif col in schema.casts:
+            expr = f"CAST({_name(col)} AS {SQL_TYPES[schema.casts[col]]})"
+        else:
+            expr = _name(col)
+        columns.append(f"{expr} AS {_name(col)}")
+    nulls = '[' + ', '.join(_literal(value) for value in CSV_NULLS) + ']'
+    return (f"SELECT {', '.join(columns)} FROM read_csv({_literal(path)}, header = true, delim = ',', quote = '\"', "
+            f"escape = '\"', types = {_struct(types)}, nullstr = {nulls})")
+
+class DuckDBBackend:
+    name = 'duckdb'
+
+    def __init__(self, source, schema=ingest.ONLINE_RETAIL_SCHEMA, workers=None,
+                 memory_limit=DUCKDB_MEMORY_LIMIT, temp_directory=DUCKDB_TEMP_DIR):
+        if duckdb is None:
+            raise ImportError("the duckdb backend needs the duckdb package")
+        config = {'temp_directory': temp_directory}
+        if workers:
+            config['threads'] = int(workers)
+        if memory_limit:
+            config['memory_limit'] = memory_limit
+        self.con = duckdb.connect(config=config)  # in-memory database, private to this backend
+        self.schema = schema
+        self._lock = threading.Lock()
+        if isinstance(source, pd.DataFrame):
+            self.con.register('raw', source)
+            self.source_dtypes = dict(source.dtypes)
+        else:
+            scan = parquet_scan(source, schema) if is_parquet(source) else csv_scan(source, schema)
+            self.con.execute(f"CREATE TEMP TABLE raw AS {scan}")
+            self.source_dtypes = None
+        columns = self._fetch("DESCRIBE raw")
+        self.columns = [row[0] for row in columns]
+        # prepare.decimal_prices: a FLOAT price is read back through its shortest decimal text
+        self.price = ("CAST(CAST(UnitPrice AS VARCHAR) AS DOUBLE)" if dict(row[:2] for row in columns)['UnitPrice'] == 'FLOAT'
+                      else "CAST(UnitPrice AS DOUBLE)")
+        self.complete = ' AND '.join(f"{_name(col)} IS NOT NULL" for col in self.columns)  # dropna()
+        self.con.execute(f"""
+            CREATE TEMP TABLE prepared AS
+            SELECT *,
+                   CAST(Quantity AS DOUBLE) * {self.price} AS TotalSales,
+                   left(CAST(InvoiceNo AS VARCHAR), 1) IN ('C', 'c') AS Canceled
+            FROM (SELECT DISTINCT * FROM raw WHERE {self.complete})
+        """)
+
+    # One connection, one query at a time: stage caches share a backend across sessions
+    def _query(self, sql, params=None):
+        with self._lock:
+            return self.con.execute(sql, params or []).df()
+
+    def _fetch(self, sql, params=None):
+        with self._lock:
+            return self.con.execute(sql, params or []).fetchall()
+
+    def _double(self, col):
+        return self.price if col == 'UnitPrice' else f"CAST({_name(col)} AS DOUBLE)"
+
+    def dtype(self, col):
+        # dtype the pandas backend gives `col` for this source
+        if self.source_dtypes is not None:
+            return self.source_dtypes[col]
+        if col in self.schema.date_columns:
+            return np.dtype('datetime64[us]')
+        dtype = self.schema.casts.get(col, self.schema.read_dtypes.get(col))
+        if dtype == 'category':
+            # read_csv's categories: every distinct value of the file, sorted
+            values = self._fetch(f"SELECT DISTINCT {_name(col)} FROM raw WHERE {_name(col)} IS NOT NULL ORDER BY 1")
+            return pd.CategoricalDtype([value for value, in values])
+        return pd.api.types.pandas_dtype(dtype)
+
+    @property
+    def rows(self):
+        return self._fetch("SELECT count(*) FROM raw")[0][0]
+
+    def clip_bounds(self, columns=clipping.CLIP_COLUMNS, qs=clipping.CLIP_QUANTILES):
+        # clipping.clip_bounds over the customer rows: the exact order statistics come from
+        # quantile_disc (nearest rank, so (rank + 0.5) / n selects `rank`), the
+        # interpolation is clipping's own
+        bounds = {}
+        for col in columns:
+            n = self._fetch(f"SELECT count({_name(col)}) FROM raw WHERE CustomerID IS NOT NULL")[0][0]
+            ranks = clipping.quantile_ranks(n, qs)
+            values = self._fetch(f"SELECT quantile_disc({self._double(col)}, ?::DOUBLE[]) FROM raw WHERE CustomerID IS NOT NULL",
+                                 [[(rank + 0.5) / n for rank in ranks]])[0][0]
+            bounds[col] = clipping.iqr_limits(*clipping.interpolate_quantiles(n, dict(zip(ranks, values)), qs))
+        return bounds
+
+    def rfm_table(self):
+        (q_lo, q_hi), (p_lo, p_hi) = (self.clip_bounds()[col] for col in clipping.CLIP_COLUMNS)
+        lines = self._query(f"""
+            SELECT CustomerID, max(InvoiceDate) AS last_date, count(DISTINCT InvoiceNo) AS frequency,
+                   fsum(least(greatest(CAST(Quantity AS DOUBLE), ?), ?) * least(greatest({self.price}, ?), ?)) AS monetary
+            FROM raw WHERE CustomerID IS NOT NULL  -- every customer row, complete or not
+            GROUP BY CustomerID ORDER BY CustomerID
+        """, [q_lo, q_hi, p_lo, p_hi]).set_index('CustomerID')
+        table = pd.DataFrame({
+            'recency': rfm.recency_days(lines['last_date'].max(), lines['last_date']),
+            'frequency': lines['frequency'].astype('int64'),
+            'monetary': lines['monetary'].astype('float64'),
+        })
+        table.index = table.index.astype(self.dtype('CustomerID'))
+        return table
+
+    def data_summary(self):
+        counts = self._fetch(f"""
+            SELECT count(DISTINCT StockCode), count(DISTINCT InvoiceNo), count(DISTINCT CustomerID), count(DISTINCT Country)
+            FROM raw WHERE {self.complete}
+        """)[0]
+        canceled = self._fetch("SELECT count(*) FROM prepared WHERE Canceled")[0][0]
+        products, transactions, customers, countries = (int(count) for count in counts)
+        return pd.DataFrame([{'Products': products,
+                              'Canceled_products': int(canceled),
+                              'Transactions': transactions,
+                              'Customers': customers,
+                              'Countries': countries
+                              }], columns=['Products', 'Canceled_products', 'Transactions', 'Customers', 'Countries'], index=['Quantity'])
+
+    def invoice_summary(self):
+        summary = self._query("""
+            SELECT CustomerID, InvoiceNo, count(*) AS "List Product per Invoice", sum(Quantity) AS "Total Quantity Product"
+            FROM prepared
+            GROUP BY CustomerID, InvoiceNo HAVING NOT bool_or(Canceled)
+            ORDER BY CustomerID, InvoiceNo
+        """)
+        return summary.astype({'CustomerID': self.dtype('CustomerID'), 'InvoiceNo': self.dtype('InvoiceNo'),
+                               'List Product per Invoice': 'int64', 'Total Quantity Product': self.dtype('Quantity')})
+
+    def product_summary(self):
+        summary = self._query("""
+            SELECT Description, sum(Quantity) AS "Total Quantity", sum(TotalSales) AS "TotalSales per Product",
+                   count(*) AS "Total orders per product"
+            FROM prepared WHERE NOT Canceled
+            GROUP BY StockCode, Description
+            ORDER BY StockCode, Description
+        """)
+        return summary.astype({'Description': self.dtype('Description'), 'Total Quantity': 'int64',
+                               'TotalSales per Product': 'float64', 'Total orders per product': 'int64'})
+
+    def sales_comparison(self):
+        total, canceled = self._fetch("""
+            SELECT coalesce(sum(TotalSales), 0), coalesce(sum(TotalSales) FILTER (WHERE Canceled), 0) FROM prepared
+        """)[0]
+        return pd.DataFrame({
+            'Status': ['Non-Canceled', 'Canceled'],
+            'Total Sales': [float(total), float(canceled)]
+        })
+
+    def close(self):
+        self.con.close()
+# End def #
+
+BACKENDS = {'pandas': PandasBackend, 'duckdb': DuckDBBackend}
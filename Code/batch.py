@@ -0,0 +1,156 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+
+import backends
+import exports
+import rfm
+import streaming
+
+# Headless runs of the dashboard's cleansing, RFM and summary pipeline, for nightly
+# jobs over one or many OnlineRetail-format CSV or Parquet files. Nothing here (or in
+# the modules it imports) touches Streamlit, plotly or matplotlib; only the dashboard
+# scripts do.
+#
+#   python batch.py data/*.csv --out results --workers 4 --format parquet --backend duckdb
+#
+# writes results/<file name>/<table>.<format> for every input plus results/manifest.json.
+# With --out-of-core the RFM table is streamed from each CSV within --memory-limit
+# (streaming.stream_rfm) instead of loading the file; the data, invoice and product
+# summaries are then only written with --backend duckdb, which spills to disk.
+
+DEFAULT_FORMAT = 'csv.gz'  # always available; parquet/feather need pyarrow
+INPUT_PATTERNS = ('*.csv', '*.csv.gz', '*.parquet')
+
+### Definition pipeline outputs ###
+# Output table -> whether its index is written (the RFM table is indexed by CustomerID,
+# the data summary by statistic)
+OUTPUTS = {
+    'rfm': True,
+    'segment_summary': False,
+    'data_summary': True,
+    'invoice_summary': False,
+    'product_summary': False,
+}
+
+def run_pipeline(backend, rfm_table=None):
+    # The same tables the dashboard shows, from a backends.open_backend(...) backend. An
+    # rfm_table computed elsewhere (streaming.stream_rfm) replaces the backend's; without
+    # a backend only the RFM tables are produced.
+    scores = rfm.rfm_scores(rfm_table if rfm_table is not None else backend.rfm_table())
+    tables = {'rfm': scores, 'segment_summary': rfm.segment_summary(scores)}
+    if backend is not None:
+        tables.update({
+            'data_summary': backend.data_summary(),
+            'invoice_summary': backend.invoice_summary(),
+            'product_summary': backend.product_summary(),
+        })
+    return tables
+# End def #
+
+### Definition one input file ###
+@dataclass
+class FileResult:
+    file: str
+    rows: int = None  # not counted when the file is only streamed
+    seconds: float = 0.0
+    outputs: list = field(default_factory=list)
+    error: str = None
+
+def output_name(path):
+    # data/2011-12-01.csv.gz -> 2011-12-01
+    name = os.path.basename(path)
+    for suffix in ('.gz', '.csv', '.parquet'):
+        if name.lower().endswith(suffix):
+            name = name[:-len(suffix)]
+    return name
+
+def run_file(path, out_dir, fmt, backend=None, agg_workers=1, memory_limit=None):
+    start = time.perf_counter()
+    if memory_limit is None:
+        source = backends.open_backend(path, backend, workers=agg_workers)
+        tables = run_pipeline(source)
+    else:
+        if backends.is_parquet(path):
+            raise ValueError("--out-of-core streams CSV files; Parquet inputs need the in-memory path")
+        source = backends.open_backend(path, 'duckdb', workers=agg_workers) if (backend or backends.DEFAULT_BACKEND) == 'duckdb' else None
+        tables = run_pipeline(source, streaming.stream_rfm(path, memory_limit=memory_limit))
+    target = os.path.join(out_dir, output_name(path))
+    os.makedirs(target, exist_ok=True)
+    outputs = [exports.write(frame, os.path.join(target, f"{name}.{fmt}"), fmt, OUTPUTS[name])
+               for name, frame in tables.items()]
+    return FileResult(path, source.rows if source is not None else None, time.perf_counter() - start, outputs)
+
+def _run_file_safely(path, out_dir, fmt, backend, agg_workers, memory_limit):
+    # A bad file is reported in the manifest instead of aborting the other files
+    try:
+        return run_file(path, out_dir, fmt, backend, agg_workers, memory_limit)
+    except Exception as exc:
+        return FileResult(path, error=f"{type(exc).__name__}: {exc}")
+# End def #
+
+### Definition batch over many files ###
+# Files are independent, so they are spread over a process pool one file per task;
+# each worker runs the aggregations single-threaded (agg_workers=1: groupby workers
+# for pandas, threads for DuckDB) rather than nesting pools inside the file pool.
+def expand_inputs(inputs):
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.extend(sorted(sum((glob.glob(os.path.join(item, pattern)) for pattern in INPUT_PATTERNS), [])))
+        else:
+            paths.append(item)
+    return paths
+
+def run_batch(paths, out_dir, fmt=DEFAULT_FORMAT, workers=1, backend=None, agg_workers=1, memory_limit=None):
+    if fmt not in exports.available_formats():
+        raise ValueError(f"unsupported output format {fmt!r}; expected one of {exports.available_formats()}")
+    names = [output_name(path) for path in paths]
+    clashes = sorted({name for name in names if names.count(name) > 1})
+    if clashes:
+        raise ValueError(f"input files would share an output directory: {clashes}")
+    if workers <= 1 or len(paths) <= 1:
+        results = [_run_file_safely(path, out_dir, fmt, backend, agg_workers, memory_limit) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+            futures = [pool.submit(_run_file_safely, path, out_dir, fmt, backend, agg_workers, memory_limit) for path in paths]
+            done = {future: future.result() for future in as_completed(futures)}
+        results = [done[future] for future in futures]
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, 'manifest.json'), 'w') as manifest:
+        json.dump([asdict(result) for result in results], manifest, indent=2)
+    return results
+# End def #
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cleansing, RFM segmentation and summaries for OnlineRetail files, without the dashboard")
+    parser.add_argument('inputs', nargs='+', help="CSV / Parquet files, or directories of them")
+    parser.add_argument('--out', required=True, help="output directory, one sub-directory per input file")
+    parser.add_argument('--format', default=DEFAULT_FORMAT, choices=exports.available_formats())
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="files processed in parallel")
+    parser.add_argument('--backend', default=backends.DEFAULT_BACKEND, choices=backends.available_backends())
+    parser.add_argument('--agg-workers', type=int, default=1, help="groupby workers (pandas) or threads (duckdb) within one file")
+    parser.add_argument('--out-of-core', action='store_true', help="stream the RFM table from each CSV instead of loading the file")
+    parser.add_argument('--memory-limit', type=float, default=streaming.DEFAULT_MEMORY_LIMIT / 2**30,
+                        help="GB each --out-of-core file may use (per worker)")
+    args = parser.parse_args(argv)
+    paths = expand_inputs(args.inputs)
+    if not paths:
+        parser.error("no input files found")
+    memory_limit = int(args.memory_limit * 2**30) if args.out_of_core else None
+    results = run_batch(paths, args.out, args.format, args.workers, args.backend, args.agg_workers, memory_limit)
+    for result in results:
+        if result.error:
+            print(f"FAILED {result.file}: {result.error}", file=sys.stderr)
+        else:
+            rows = f"{result.rows:,} rows" if result.rows is not None else "streamed"
+            print(f"{result.file}: {rows} in {result.seconds:.1f}s -> {len(result.outputs)} tables")
+    return 1 if any(result.error for result in results) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,212 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import clipping
+import parallel
+import prepare
+import ranking
+import rfm
+import summaries
+
+### Definition synthetic OnlineRetail data ###
+# Same columns and dtypes as ingest.ONLINE_RETAIL_SCHEMA produces, built in memory so
+# benchmarks at tens of millions of rows do not depend on a CSV of that size.
+def synthetic_transactions(rows, customers=None, seed=0):
+    rng = np.random.default_rng(seed)
+    customers = customers or max(rows // 100, 10)
+    invoices = max(rows // 20, 1)
+    invoice = rng.integers(0, invoices, rows)
+    canceled = rng.random(invoices) < 0.02
+    invoice_no = pd.Categorical.from_codes(
+        invoice, np.where(canceled, 'C', '') + (536365 + np.arange(invoices)).astype(str))
+    start = np.datetime64('2010-12-01T08:00', 'm')
+    invoice_time = start + np.sort(rng.integers(0, 373 * 24 * 60, invoices)).astype('timedelta64[m]')
+    quantity = rng.integers(1, 30, rows).astype('int32')
+    return pd.DataFrame({
+        'InvoiceNo': invoice_no,
+        'StockCode': pd.Categorical.from_codes(rng.integers(0, 4000, rows), [f"S{i}" for i in range(4000)]),
+        'Quantity': np.where(canceled[invoice], -quantity, quantity).astype('int32'),
+        'InvoiceDate': invoice_time[invoice].astype('datetime64[ns]'),
+        'UnitPrice': np.round(rng.gamma(2.0, 2.0, rows), 2).astype('float32'),  # prices in pence
+        'CustomerID': pd.array(rng.integers(12346, 12346 + customers, invoices)[invoice], dtype='Int32'),
+        'Country': pd.Categorical.from_codes(rng.integers(0, 38, invoices)[invoice], [f"Country {i}" for i in range(38)]),
+    })
+# End def #
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+### Benchmarks ###
+def cleansing_lambda(df):
+    # CleansingData before it was vectorised, kept as the baseline: sorted-quantile clipping,
+    # TotalPrice via eval and one Python lambda per customer and measure
+    df = df[df['CustomerID'].notnull()]
+    clip_sorted(df)
+    df['InvoiceDate'] = pd.to_datetime(df['InvoiceDate'])
+    fixDate = np.max(df['InvoiceDate'])
+    df = df.eval("TotalPrice = Quantity * UnitPrice")
+    Data_clean = df.groupby(['CustomerID']).agg(
+        {
+            'InvoiceDate': lambda date: (fixDate - date.max()).days,
+            'InvoiceNo': lambda num: num.nunique(),
+            'TotalPrice': lambda price: price.sum()
+        }
+    )
+    Data_clean.columns = ['recency', 'frequency', 'monetary']
+    return Data_clean
+
+def bench_rfm(rows, baseline=True):
+    df = synthetic_transactions(rows)
+    fast, fast_time = timed(lambda: rfm.rfm_table(summaries.cleanse_for_rfm(df)))
+    line = f"rfm_table  rows={rows:>11,} customers={len(fast):>9,} vectorized={fast_time:8.2f}s"
+    if baseline:
+        # The frame the untyped pd.read_csv used to give: float64 prices and CustomerIDs
+        untyped = df.astype({'UnitPrice': 'float64', 'CustomerID': 'float64'}).round({'UnitPrice': 2})
+        slow, slow_time = timed(cleansing_lambda, untyped)
+        pd.testing.assert_frame_equal(fast, slow, check_index_type=False, rtol=1e-12)
+        line += f" lambdas={slow_time:8.2f}s speedup={slow_time / fast_time:6.1f}x"
+    print(line, flush=True)
+
+def segment_label(RFMScore):
+    # The row-wise segment mapping RFMmodel used before the lookup table
+    if RFMScore in ['54', '55']:
+        return "Champion"
+    elif RFMScore == '52':
+        return "Recent User"
+    elif RFMScore == '51':
+        return "Price Sensitive"
+    elif RFMScore in ['42', '43', '52', '53']:
+        return "Potential Loyalist"
+    elif RFMScore == '41':
+        return "Promising"
+    elif RFMScore in ['34', '35', '44', '45']:
+        return "Loyal Customer"
+    elif RFMScore == '33':
+        return "Needs Attention"
+    elif RFMScore in ['31', '32']:
+        return "About to Sleep"
+    elif RFMScore in ['15', '25']:
+        return "Can't Lose Them"
+    elif RFMScore in ['13', '14', '23', '24']:
+        return "Hibernating"
+    elif RFMScore in ['11', '12', '21', '22']:
+        return "Lost"
+    else:
+        return "Don't have segment label"
+
+def bench_segment(customers, baseline=True):
+    rng = np.random.default_rng(0)
+    recency_score = rng.integers(1, 6, customers).astype('int8')
+    fm_score = rng.integers(1, 6, customers).astype('int8')
+    lookup = rfm.SegmentLookup()
+    fast, fast_time = timed(lookup, recency_score, fm_score)
+    line = f"segment    customers={customers:>11,} lookup={fast_time * 1000:8.1f}ms"
+    if baseline:
+        scores = pd.Series(recency_score.astype(str)).str.cat(fm_score.astype(str))
+        slow, slow_time = timed(scores.apply, segment_label)
+        assert (np.asarray(fast, dtype=object) == slow.to_numpy()).all()
+        line += f" apply={slow_time:8.2f}s speedup={slow_time / fast_time:8.0f}x"
+    print(line, flush=True)
+
+def clip_sorted(df):
+    # The CleansingData winsorizer before clipping.clip_outliers
+    for col in ['Quantity', 'UnitPrice']:
+        series = sorted(df[col])
+        Q1, Q3 = np.quantile(series, [0.01, 0.99])
+        IQR = Q3 - Q1
+        lowerLimit = Q1 - (1.5 * IQR)
+        upperLimit = Q3 + (1.5 * IQR)
+        df[col] = np.where(df[col] < lowerLimit, lowerLimit, df[col])
+        df[col] = np.where(df[col] > upperLimit, upperLimit, df[col])
+
+def bench_clip(rows, baseline=True):
+    df = synthetic_transactions(rows)[['Quantity', 'UnitPrice']]
+    _, fast_time = timed(clipping.clip_outliers, df.copy())
+    line = f"clip       rows={rows:>11,} partition={fast_time:8.2f}s"
+    if baseline:
+        _, slow_time = timed(clip_sorted, df.copy())
+        line += f" sorted={slow_time:8.2f}s speedup={slow_time / fast_time:6.1f}x"
+    print(line, flush=True)
+
+GROUPBY_QUERIES = {
+    'product': (['StockCode', 'Description'], {'Quantity': 'sum', 'TotalSales': 'sum', 'StockCode': 'count'}, False),
+    'invoice': (['CustomerID', 'InvoiceNo'], {'InvoiceDate': 'count', 'Quantity': 'sum'}, False),
+    'rfm': ('CustomerID', {'InvoiceDate': 'max', 'InvoiceNo': 'nunique', 'TotalSales': 'sum'}, True),
+}
+
+def bench_groupby(rows, baseline=True, workers=(1, 2, 4, 8)):
+    df = synthetic_transactions(rows)
+    df['TotalSales'] = df['Quantity'] * prepare.decimal_prices(df['UnitPrice'])
+    df['Description'] = df['StockCode'].cat.rename_categories(lambda code: f"PRODUCT {code}")
+    for name, (by, spec, as_index) in GROUPBY_QUERIES.items():
+        serial, serial_time = timed(df.groupby(by, as_index=as_index, observed=True, sort=True).agg, spec)
+        line = f"groupby    rows={rows:>11,} {name:<8} serial={serial_time:6.2f}s"
+        for count in workers:
+            parallel.groupby_agg(df.head(parallel.MIN_PARALLEL_ROWS), by, spec, count, as_index)  # start the pool
+            result, parallel_time = timed(parallel.groupby_agg, df, by, spec, count, as_index)
+            pd.testing.assert_frame_equal(serial, result)
+            line += f" w{count}={parallel_time:6.2f}s"
+        print(line, flush=True)
+
+TOPN_MEASURES = ['Quantity', 'TotalSales', 'Lines']
+
+def bench_topn(skus, baseline=True, n=5, deltas=50, delta_rows=1000):
+    rng = np.random.default_rng(0)
+    products = pd.DataFrame({
+        'StockCode': np.arange(skus),
+        'Quantity': rng.zipf(1.5, skus).astype('float64'),
+        'TotalSales': rng.gamma(2.0, 50.0, skus),
+        'Lines': rng.integers(1, 200, skus).astype('float64'),
+    })
+    positions, fast_time = timed(ranking.top_positions, products[TOPN_MEASURES].to_numpy().T, n)
+    line = f"topn       skus={skus:>11,} one-pass={fast_time * 1000:8.1f}ms"
+    if baseline:
+        slow, slow_time = timed(lambda: [products.nlargest(n, measure).index.to_numpy() for measure in TOPN_MEASURES])
+        assert all(np.array_equal(fast, expected) for fast, expected in zip(positions, slow))
+        line += f" nlargest={slow_time * 1000:8.1f}ms"
+
+    # New transactions arriving in small batches: maintained leaders vs a full re-rank
+    board = ranking.Leaderboard(['StockCode'], TOPN_MEASURES)
+    board.update(products)
+    board.top(n)
+    incremental = full = 0.0
+    for _ in range(deltas):
+        delta = pd.DataFrame({
+            'StockCode': rng.integers(0, skus, delta_rows),
+            'Quantity': rng.integers(1, 50, delta_rows).astype('float64'),
+            'TotalSales': rng.gamma(2.0, 50.0, delta_rows),
+            'Lines': np.ones(delta_rows),
+        })
+        leaders, update_time = timed(lambda: (board.update(delta), board.top(n))[1])
+        incremental += update_time
+        if baseline:
+            totals, full_time = timed(lambda: pd.DataFrame(board.totals[:, :len(board)].T, columns=TOPN_MEASURES))
+            expected, rank_time = timed(lambda: [totals.nlargest(n, measure).index.to_numpy() for measure in TOPN_MEASURES])
+            full += full_time + rank_time
+            assert all(np.array_equal(leaders[measure]['StockCode'].to_numpy(), rows) for measure, rows in zip(TOPN_MEASURES, expected))
+    line += f" delta update+top={incremental / deltas * 1000:7.2f}ms"
+    if baseline:
+        line += f" re-rank={full / deltas * 1000:7.2f}ms"
+    print(line, flush=True)
+
+BENCHMARKS = {
+    'groupby': bench_groupby,
+    'clip': bench_clip,
+    'rfm': bench_rfm,
+    'segment': bench_segment,
+    'topn': bench_topn,
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks for the dashboard pipeline on synthetic data")
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000_000, 10_000_000, 50_000_000])
+    parser.add_argument('--no-baseline', action='store_true', help="skip the slow pre-optimisation implementation")
+    args = parser.parse_args()
+    for rows in args.rows:
+        BENCHMARKS[args.benchmark](rows, baseline=not args.no_baseline)
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+TIME_PERIODS = ['Morning', 'Afternoon', 'Evening', 'Night']
+# Time period code of every hour 0-23: Night before 6, then 6-hour Morning / Afternoon / Evening
+HOUR_PERIODS = np.array([3] * 6 + [0] * 6 + [1] * 6 + [2] * 6, dtype='int8')
+
+### Definition calendar codes ###
+# Calendar features as integer codes, computed with integer arithmetic on the
+# timestamps' seconds since 1970-01-01 instead of per-field datetime accessors:
+#   Day      days since 1970-01-01 (int32)
+#   Month    months since 1970-01 (int32)
+#   Hour     0-23 (int8)
+#   Weekday  0 = Monday .. 6 = Sunday (int8)
+#   Period   index into TIME_PERIODS (int8)
+# Charts group on the codes; the *_labels functions turn the (few) grouped codes into
+# display strings.
+def calendar_codes(timestamps):
+    seconds = np.asarray(timestamps, dtype='datetime64[s]').astype('int64')
+    days = seconds // 86400
+    hours = (seconds - days * 86400) // 3600
+    return {
+        'Day': days.astype('int32'),
+        'Month': month_codes(days),
+        'Hour': hours.astype('int8'),
+        'Weekday': weekday_codes(days),
+        'Period': HOUR_PERIODS[hours],
+    }
+
+def day_codes(dates):
+    # Day code of a date, timestamp or array of them
+    days = np.asarray(pd.to_datetime(dates), dtype='datetime64[D]').astype('int64')
+    return int(days) if days.ndim == 0 else days
+
+def month_codes(days):
+    return np.asarray(days, dtype='int64').astype('datetime64[D]').astype('datetime64[M]').astype('int32')
+
+def month_first_days(months):
+    # Day code of the first day of each month code
+    return np.asarray(months, dtype='int64').astype('datetime64[M]').astype('datetime64[D]').astype('int64')
+
+def weekday_codes(days):
+    return ((np.asarray(days, dtype='int64') + 3) % 7).astype('int8')  # 1970-01-01 was a Thursday
+
+def period_codes(hours):
+    return HOUR_PERIODS[np.asarray(hours, dtype='int64')]
+
+def day_years(days):
+    return np.asarray(days, dtype='int64').astype('datetime64[D]').astype('datetime64[Y]').astype('int64') + 1970
+
+def day_end(date):
+    # Exclusive upper bound that keeps the whole of `date`
+    return pd.Timestamp(date).normalize() + pd.Timedelta(days=1)
+# End def #
+
+### Definition labels ###
+def day_labels(days):
+    return np.datetime_as_string(np.asarray(days, dtype='int64').astype('datetime64[D]'), unit='D')
+
+def month_labels(months):
+    return np.datetime_as_string(np.asarray(months, dtype='int64').astype('datetime64[M]'), unit='M')
+
+def weekday_labels(weekdays):
+    return np.array(WEEKDAYS)[np.asarray(weekdays, dtype='int64')]
+
+def period_labels(periods):
+    return np.array(TIME_PERIODS)[np.asarray(periods, dtype='int64')]
+# End def #
@@ -0,0 +1,100 @@
+from dataclasses import dataclass
+
+import pandas as pd
+
+import cube
+import ranking
+
+# Row-level payloads are estimated from a sample of this many rows
+PAYLOAD_SAMPLE_ROWS = 1000
+
+### Definition chart specification ###
+# A chart declares what it shows, not which frame it is drawn from:
+#   dimensions  columns the marks are keyed on (pie slices, bar categories, ...)
+#   measures    output column -> (source column, aggregation)
+#   top         keep only the `top` largest rows of `sort_by` (default: first measure)
+# The figure only ever receives the aggregated result.
+@dataclass(frozen=True)
+class ChartSpec:
+    dimensions: tuple
+    measures: dict
+    top: int = None
+    sort_by: str = None
+# End def #
+
+### Definition payload statistics ###
+# rows_in / bytes_in describe what a chart drawn straight from the row-level frame
+# would have serialised; rows_out / bytes_out what is actually handed to the figure.
+@dataclass
+class PayloadStats:
+    name: str
+    rows_in: int
+    bytes_in: int
+    rows_out: int
+    bytes_out: int
+
+    @property
+    def reduction(self):
+        return self.bytes_in / self.bytes_out if self.bytes_out else float('inf')
+
+    def __str__(self):
+        return (f"{self.name}: {self.rows_out:,} of {self.rows_in:,} rows, "
+                f"{self.bytes_out / 1024:,.1f} KB instead of ~{self.bytes_in / 1024:,.1f} KB")
+# End def #
+
+@dataclass
+class ChartData:
+    frame: pd.DataFrame
+    stats: PayloadStats
+
+def payload_bytes(frame):
+    # Plotly sends figure data to the browser as JSON; measure the same encoding
+    if len(frame) <= PAYLOAD_SAMPLE_ROWS:
+        return len(frame.to_json(orient='values', date_format='iso'))
+    sample = frame.iloc[:PAYLOAD_SAMPLE_ROWS].to_json(orient='values', date_format='iso')
+    return int(len(sample) * len(frame) / PAYLOAD_SAMPLE_ROWS)
+
+### Definition aggregate-before-plot ###
+def rollup(sales_cube, spec, name, countries=None, start=None, end=None):
+    # The chart's dimensions and measures over the matching rows, read from a cube.SalesCube
+    measures = {}
+    for out, (source, func) in spec.measures.items():
+        if (source, func) not in cube.MEASURES:
+            raise ValueError(f"chart '{name}' needs {func} of {source}, which the sales cube does not hold")
+        measures[cube.MEASURES[(source, func)]] = out
+    grouped = sales_cube.query(spec.dimensions, countries, start, end)
+    missing = [measure for measure in measures if measure not in grouped]
+    if missing:
+        raise ValueError(f"chart '{name}' needs {missing} per {list(spec.dimensions)}, which the sales cube does not hold")
+    lines = int(grouped['Lines'].sum()) if 'Lines' in grouped else sales_cube.n_rows
+    grouped = grouped[list(spec.dimensions) + list(measures)].rename(columns=measures)
+    if spec.top is not None:
+        grouped = grouped.iloc[ranking.top_positions(grouped[spec.sort_by or next(iter(spec.measures))], spec.top)]
+    sources = list(dict.fromkeys(list(spec.dimensions) + [source for source, _ in spec.measures.values()]))
+    return ChartData(grouped, cube_stats(sales_cube, name, sources, lines, grouped))
+
+def summarize(sales_cube, func, name, sources, **filters):
+    # A chart dataset that a summaries function rolls up from the cube (sales over time,
+    # orders per country), with its payload: the row-level alternative is every matching
+    # line item restricted to `sources`
+    frame = func(sales_cube, **filters)
+    lines = int(sales_cube.query(['Country'], **filters)['Lines'].sum())
+    return ChartData(frame, cube_stats(sales_cube, name, sources, lines, frame))
+
+def cube_stats(sales_cube, name, sources, lines, frame):
+    return PayloadStats(name, lines, sales_cube.source_bytes(sources, lines), len(frame), payload_bytes(frame))
+
+def leaders(data, n, columns, names):
+    # Narrows an existing aggregate (e.g. a product summary) to its n largest rows for each
+    # ranking column, selected in one pass without regrouping the rows
+    positions = ranking.top_positions(data.frame[list(columns)].to_numpy(dtype='float64').T, n)
+    result = []
+    for rows, name in zip(positions, names):
+        frame = data.frame.iloc[rows]
+        result.append(ChartData(frame, PayloadStats(name, data.stats.rows_in, data.stats.bytes_in, len(frame), payload_bytes(frame))))
+    return result
+
+def payload_table(stats_list):
+    return pd.DataFrame([vars(stats) for stats in stats_list],
+                        columns=['name', 'rows_in', 'bytes_in', 'rows_out', 'bytes_out'])
+# End def #
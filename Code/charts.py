@@ -0,0 +1,167 @@
+import io
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import squarify
+import streamlit as st
+from matplotlib.figure import Figure
+
+import chart_data
+import downsample
+import exports
+
+### Definition downsampled line chart ###
+# Sends at most ~one point per pixel of `width` to the browser (LTTB by default). When
+# the series is larger than that, a zoom slider re-slices the full-resolution series on
+# the server, so a narrower window is drawn with proportionally finer detail.
+def zoomable_line(data, x, y, title, key, width=1000, height=500, method='lttb', **line_kwargs):
+    budget = downsample.points_for_width(width)
+    data = data.sort_values(x, kind='stable')
+    x_values = data[x]
+    is_time = not pd.api.types.is_numeric_dtype(x_values)
+    if is_time:
+        x_values = pd.to_datetime(x_values)
+    window = data
+    if len(data) > budget:
+        first, last = x_values.iloc[0], x_values.iloc[-1]
+        if is_time:
+            first, last = first.to_pydatetime(), last.to_pydatetime()
+        low, high = st.slider(f"Zoom: {title}", min_value=first, max_value=last, value=(first, last), key=key)
+        start = x_values.searchsorted(pd.Timestamp(low) if is_time else low, side='left')
+        stop = x_values.searchsorted(pd.Timestamp(high) if is_time else high, side='right')
+        window = data.iloc[start:stop]
+        x_numeric = x_values.iloc[start:stop]
+        x_numeric = x_numeric.astype('int64') if is_time else x_numeric
+        window = window.iloc[downsample.downsample_indices(x_numeric, window[y], budget, method)]
+        st.caption(f"{len(window):,} of {stop - start:,} points shown")
+    fig = px.line(window, x=x, y=y, title=title, height=height, width=width, **line_kwargs)
+    st.plotly_chart(fig, use_container_width=True)
+    return fig
+# End def #
+
+### Definition server-side paged table ###
+# Only the visible page is sent to the browser. Sorting uses argsort permutations that are
+# computed once per (data version, column) and reused across reruns and pages; filters are
+# vectorised masks evaluated on the server (on the categories only, for categoricals).
+PAGE_SIZES = [25, 50, 100, 500]
+_SORT_CACHE_ENTRIES = 32
+_sort_orders = OrderedDict()
+
+def sort_order(df, column, token=None):
+    # Without a token the frame has no stable identity across reruns, so nothing is cached
+    cache_key = (token, column, len(df))
+    if token is not None and cache_key in _sort_orders:
+        _sort_orders.move_to_end(cache_key)
+        return _sort_orders[cache_key]
+    values = df[column]
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # Rank the categories once, then sort the integer ranks (missing values last)
+        ranks = np.append(np.argsort(np.argsort(values.cat.categories.to_numpy(), kind='stable')), len(values.cat.categories))
+        order = np.argsort(ranks[values.cat.codes.to_numpy()], kind='stable')
+    elif isinstance(values.dtype, np.dtype) and values.dtype.kind in 'biufmM':
+        order = np.argsort(values.to_numpy(), kind='stable')
+    else:
+        order = values.reset_index(drop=True).sort_values(kind='stable', na_position='last').index.to_numpy()
+    if token is None:
+        return order
+    _sort_orders[cache_key] = order
+    if len(_sort_orders) > _SORT_CACHE_ENTRIES:
+        _sort_orders.popitem(last=False)
+    return order
+
+def filter_mask(values, query):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        hits = np.append(values.cat.categories.astype(str).str.contains(query, case=False, regex=False), False)
+        return hits[values.cat.codes.to_numpy()]
+    return values.astype(str).str.contains(query, case=False, regex=False).to_numpy(dtype=bool)
+
+def paged_table(df, key, token=None, page_size=50):
+    c1, c2, c3, c4 = st.columns([2, 1, 2, 2])
+    with c1:
+        sort_column = st.selectbox("Sort by", ['(none)'] + list(df.columns), key=f"{key}_sort")
+    with c2:
+        descending = st.toggle("Descending", key=f"{key}_desc")
+    with c3:
+        filter_column = st.selectbox("Filter column", ['(none)'] + list(df.columns), key=f"{key}_filter_col")
+    with c4:
+        query = st.text_input("Contains", key=f"{key}_filter", disabled=filter_column == '(none)')
+
+    positions = np.arange(len(df))
+    if sort_column != '(none)':
+        positions = sort_order(df, sort_column, token)
+        if descending:
+            positions = positions[::-1]
+    if filter_column != '(none)' and query:
+        positions = positions[filter_mask(df[filter_column], query)[positions]]
+
+    page_size = st.selectbox("Rows per page", PAGE_SIZES, index=PAGE_SIZES.index(page_size), key=f"{key}_size")
+    pages = max(1, -(-len(positions) // page_size))
+    page = st.number_input(f"Page (of {pages:,})", min_value=1, max_value=pages, value=1, key=f"{key}_page")
+    start = (page - 1) * page_size
+    st.dataframe(df.iloc[positions[start:start + page_size]], use_container_width=True)
+    st.caption(f"Rows {min(start + 1, len(positions)):,}-{min(start + page_size, len(positions)):,} of {len(positions):,}")
+# End def #
+
+### Definition chart payload report ###
+def payload_report(stats_list, title="Chart payloads"):
+    with st.expander(title):
+        table = chart_data.payload_table(stats_list)
+        table['reduction'] = [f"{stats.reduction:,.0f}x" for stats in stats_list]
+        st.dataframe(table, use_container_width=True, hide_index=True)
+# End def #
+
+### Definition cached segment treemap ###
+# Rendered once per distinct set of segment counts and served as PNG bytes afterwards.
+# The Figure is created directly (not through pyplot), so no global figure is left open
+# between reruns.
+SEGMENT_COLORS = ['#070F2B', '#1B1A55', '#535C91', '#9290C3']
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def segment_treemap_png(labels, values, total, figsize=(18, 11), dpi=100):
+    fig = Figure(figsize=figsize, facecolor='none')
+    try:
+        ax = fig.subplots()
+        labels_with_percentage = [f"{label} ({value / total * 100:.2f}%)" for label, value in zip(labels, values)]
+        squarify.plot(sizes=list(values), color=SEGMENT_COLORS, label=labels_with_percentage, ax=ax,
+                      text_kwargs={'color': 'white', 'fontsize': 12})
+        ax.set_title('Customer segmentation', fontsize=16)
+        ax.set_xlabel('Recency', color='white', fontsize=16)
+        ax.set_ylabel('FMScore', color='white', fontsize=16)
+        ax.tick_params(axis='x', colors='white', labelsize=14)
+        ax.tick_params(axis='y', colors='white', labelsize=14)
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format='png', dpi=dpi, bbox_inches='tight', transparent=True)
+    finally:
+        fig.clear()
+    return buffer.getvalue()
+
+def segment_treemap(counts, total):
+    # counts: customers per segment (rfm.segment_counts)
+    png = segment_treemap_png(tuple(counts.index), tuple(int(value) for value in counts), int(total))
+    st.image(png, use_container_width=True)
+# End def #
+
+### Definition on-demand export ###
+# Nothing is serialised until "Prepare" is clicked. The export is then written to disk in
+# chunks (exports.export) and the download button streams that file; it is cached by
+# `token` (or a hash of the frame), so preparing the same data again is a file lookup.
+def export_button(frame, label, file_name, key, token=None, index=True):
+    ready_key = f"{key}_export"
+    c1, c2 = st.columns([1, 2])
+    with c1:
+        fmt = st.selectbox("Format", exports.available_formats(), key=f"{key}_format", label_visibility='collapsed')
+    with c2:
+        if st.button(f"Prepare {label}", key=f"{key}_prepare"):
+            with st.spinner(f"Writing {fmt}"):
+                st.session_state[ready_key] = (fmt, exports.export(frame, fmt, key=token, index=index))
+    ready = st.session_state.get(ready_key)
+    if ready is None or ready[0] != fmt or not os.path.exists(ready[1]):
+        return
+    with open(ready[1], 'rb') as export_file:
+        if st.download_button(f"Download {file_name}.{fmt}", data=export_file, file_name=f"{file_name}.{fmt}",
+                              mime=exports.FORMATS[fmt], key=f"{key}_download"):
+            del st.session_state[ready_key]  # hand the file over once, then go back to "Prepare"
+# End def #
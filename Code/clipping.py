@@ -0,0 +1,120 @@
+import math
+
+import numpy as np
+
+CLIP_COLUMNS = ['Quantity', 'UnitPrice']
+CLIP_QUANTILES = (0.01, 0.99)
+
+### Definition IQR limits ###
+def iqr_limits(q1, q3):
+    iqr = q3 - q1
+    return q1 - (1.5 * iqr), q3 + (1.5 * iqr)
+# End def #
+
+### Definition exact quantiles ###
+# np.partition only orders the elements around the requested ranks (O(n)), instead of
+# sorting the whole column; interpolation matches np.quantile's default ('linear').
+# quantile_ranks / interpolate_quantiles are the two halves, for callers that fetch
+# the order statistics elsewhere (e.g. backends.DuckDBBackend).
+def quantile_ranks(n, qs=CLIP_QUANTILES):
+    # 0-based ranks of the order statistics the quantiles at qs interpolate between
+    if n == 0:
+        raise ValueError("Cannot compute quantiles of an empty column")
+    positions = [(n - 1) * q for q in qs]
+    return sorted({int(math.floor(h)) for h in positions} | {min(int(math.floor(h)) + 1, n - 1) for h in positions})
+
+def interpolate_quantiles(n, order_statistics, qs=CLIP_QUANTILES):
+    # order_statistics: {rank: value} for every rank in quantile_ranks(n, qs)
+    result = []
+    for q in qs:
+        h = (n - 1) * q
+        lo = int(math.floor(h))
+        hi = min(lo + 1, n - 1)
+        result.append(order_statistics[lo] + (h - lo) * (order_statistics[hi] - order_statistics[lo]))
+    return result
+
+def exact_quantiles(values, qs=CLIP_QUANTILES):
+    partitioned = np.array(values, dtype='float64')  # private copy, partitioned in place
+    n = len(partitioned)
+    ranks = quantile_ranks(n, qs)
+    partitioned.partition(ranks)
+    return interpolate_quantiles(n, {rank: partitioned[rank] for rank in ranks}, qs)
+# End def #
+
+### Definition KLL quantile sketch ###
+# Mergeable, bounded-memory quantile sketch (Karnin, Lang & Liberty, 2016). Level h holds
+# items of weight 2**h; a full level is sorted and every other item is promoted. The
+# normalized rank error is about 1.65 / k, so k is derived from the requested epsilon.
+class QuantileSketch:
+    def __init__(self, epsilon=0.001, seed=0):
+        self.epsilon = epsilon
+        self.k = max(8, math.ceil(1.65 / epsilon))
+        self.levels = [np.empty(0)]
+        self.count = 0
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, math.ceil(self.k * (2 / 3) ** depth))
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # An odd item stays behind so the total weight is preserved
+                keep = items[:1] if len(items) % 2 else items[:0]
+                pairs = items[len(keep):]
+                promoted = pairs[self._rng.integers(0, 2)::2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def update(self, values):
+        values = np.asarray(values, dtype='float64')
+        values = values[~np.isnan(values)]
+        self.count += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self._compress()
+        return self
+
+    def quantiles(self, qs=CLIP_QUANTILES):
+        if self.count == 0:
+            raise ValueError("Cannot compute quantiles of an empty sketch")
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** level) for level, items in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        values, cumulative = values[order], np.cumsum(weights[order])
+        total = cumulative[-1]
+        return [values[min(np.searchsorted(cumulative, q * total, side='left'), len(values) - 1)] for q in qs]
+
+    @property
+    def size(self):
+        return sum(len(items) for items in self.levels)
+# End def #
+
+### Definition in-place clipping ###
+def clip_bounds(df, columns=CLIP_COLUMNS, qs=CLIP_QUANTILES):
+    return {col: iqr_limits(*exact_quantiles(df[col].to_numpy(), qs)) for col in columns}
+
+def clip_outliers(df, columns=CLIP_COLUMNS, qs=CLIP_QUANTILES, bounds=None):
+    # Winsorise each column to its IQR limits: one float64 buffer per column, clipped in place
+    bounds = bounds or clip_bounds(df, columns, qs)
+    for col in columns:
+        values = df[col].to_numpy(dtype='float64', copy=True)
+        np.clip(values, *bounds[col], out=values)
+        df[col] = values
+    return bounds
+# End def #
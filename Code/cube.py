@@ -0,0 +1,290 @@
+import numpy as np
+import pandas as pd
+
+import calendar_features
+
+# Measures kept per cell, and the row-level aggregation each one answers
+MEASURES = {
+    ('TotalSales', 'sum'): 'TotalSales',
+    ('Quantity', 'sum'): 'Quantity',
+    ('StockCode', 'count'): 'Lines',
+    ('InvoiceNo', 'nunique'): 'Invoices',
+}
+TIME_DIMENSIONS = ('Day', 'Month', 'Weekday', 'Hour', 'Period')
+PRODUCT_DIMENSIONS = ('StockCode', 'Description')
+# Group spaces up to this many slots are summed with dense bincounts, larger ones are sorted
+MAX_DENSE_GROUPS = 2**26
+PAYLOAD_SAMPLE_ROWS = 1000
+
+def _codes(values):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), values.cat.categories
+    return pd.factorize(values, sort=True)
+
+def _rollup(keys, n_groups, columns):
+    # Distinct keys in ascending order, the number of rows and the column sums of each
+    if n_groups <= MAX_DENSE_GROUPS:
+        counts = np.bincount(keys, minlength=n_groups)
+        uniques = np.flatnonzero(counts)
+        sums = {name: np.bincount(keys, weights=values, minlength=n_groups)[uniques] for name, values in columns.items()}
+        return uniques, counts[uniques], sums
+    uniques, groups = np.unique(keys, return_inverse=True)
+    sums = {name: np.bincount(groups, weights=values, minlength=len(uniques)) for name, values in columns.items()}
+    return uniques, np.bincount(groups, minlength=len(uniques)), sums
+
+def _product_codes(frame):
+    # Group number of every row's (StockCode, Description) pair, in groupby(sort=True)
+    # order, and the pairs themselves
+    (stock, stocks), (description, descriptions) = (_codes(frame[col]) for col in PRODUCT_DIMENSIONS)
+    pair = stock.astype('int64') * max(len(descriptions), 1) + description
+    n_pairs = len(stocks) * max(len(descriptions), 1)
+    if n_pairs <= MAX_DENSE_GROUPS:
+        present = np.bincount(pair, minlength=n_pairs) > 0
+        uniques = np.flatnonzero(present)
+        product = (np.cumsum(present) - 1)[pair]
+    else:
+        uniques, product = np.unique(pair, return_inverse=True)
+    stock_codes, description_codes = np.divmod(uniques, max(len(descriptions), 1))
+    products = pd.DataFrame({
+        'StockCode': pd.Series(stocks.take(stock_codes)).astype(frame['StockCode'].dtype),
+        'Description': pd.Series(descriptions.take(description_codes)).astype(frame['Description'].dtype),
+    })
+    return product, products
+
+def _positions(time, offsets, country_codes, lo, hi):
+    # Rows of a (Country, time)-sorted table with lo <= time < hi in the given countries
+    if country_codes is None:
+        if len(time) == 0 or (lo <= time.min() and hi > time.max()):
+            return slice(None)
+        country_codes = range(len(offsets) - 1)
+    parts = []
+    for code in country_codes:
+        start, stop = offsets[code], offsets[code + 1]
+        segment = time[start:stop]
+        parts.append(np.arange(start + np.searchsorted(segment, lo), start + np.searchsorted(segment, hi)))
+    return np.concatenate(parts) if parts else np.empty(0, dtype='int64')
+
+### Definition sales cube ###
+# Pre-aggregated sales of the (non-canceled) transactions, built once per dataset:
+#   orders          one row per (Day, Hour, Country): TotalSales, Quantity, Lines, Invoices
+#   product_days    one row per (Country, Day, product): TotalSales, Quantity, Lines
+#   product_months  the same per (Country, Month, product)
+# where product is a (StockCode, Description) pair; Month and Weekday are derived from
+# Day and Period from Hour. Every time, country and product chart is a roll-up of one of the tables:
+#   - orders is sorted by Day, so a date range is a searchsorted slice and a country
+#     filter a mask over a small int column;
+#   - the product tables are sorted by Country then time, so a country and date
+#     selection is a searchsorted slice per country. Whole months of a date range are
+#     read from product_months and only the partial months at its ends from product_days.
+# Invoice counts are not additive across products, so they exist only in orders, and
+# products are not broken down by hour or time period.
+class SalesCube:
+    def __init__(self, orders, product_days, product_months, countries, products, n_rows, row_bytes):
+        self.orders = orders
+        self.product_days = product_days
+        self.product_months = product_months
+        self.countries = countries
+        self.products = products
+        self.n_rows = n_rows
+        self.row_bytes = row_bytes
+        days = orders['Day'].to_numpy()
+        self.first_day = int(days[0]) if len(days) else 0
+        self.last_day = int(days[-1]) if len(days) else 0
+        self.first_month = int(calendar_features.month_codes(self.first_day))
+        self.n_days = self.last_day - self.first_day + 1
+        self.n_months = int(calendar_features.month_codes(self.last_day)) - self.first_month + 1
+        n_countries = max(len(countries), 1)
+        self.day_offsets = np.searchsorted(product_days['Country'].to_numpy(), np.arange(n_countries + 1))
+        self.month_offsets = np.searchsorted(product_months['Country'].to_numpy(), np.arange(n_countries + 1))
+
+    @classmethod
+    def build(cls, frame, invoices=None):
+        # frame: prepared line items (e.g. PreparedTransactions.non_canceled);
+        # invoices: the matching invoice headers, for the Invoices measure
+        day = frame['Day'].to_numpy().astype('int64')
+        first_day = int(day.min()) if len(day) else 0
+        day -= first_day
+        n_days = int(day.max()) + 1 if len(day) else 1
+        hour = frame['Hour'].to_numpy().astype('int64')
+        country, countries = _codes(frame['Country'])
+        country = country.astype('int64')
+        product, products = _product_codes(frame)
+        n_countries, n_products = max(len(countries), 1), max(len(products), 1)
+        measures = {'TotalSales': frame['TotalSales'].to_numpy(dtype='float64'),
+                    'Quantity': frame['Quantity'].to_numpy(dtype='float64')}
+
+        keys, lines, sums = _rollup((day * 24 + hour) * n_countries + country, n_days * 24 * n_countries, measures)
+        rest, country_code = np.divmod(keys, n_countries)
+        day_code, hour_code = np.divmod(rest, 24)
+        orders = pd.DataFrame({
+            'Day': (day_code + first_day).astype('int32'),
+            'Hour': hour_code.astype('int8'),
+            'Country': country_code.astype('int16'),
+            'TotalSales': sums['TotalSales'],
+            'Quantity': np.rint(sums['Quantity']).astype('int64'),
+            'Lines': lines.astype('int64'),
+            'Invoices': np.zeros(len(keys), dtype='int64'),
+        })
+        if invoices is not None and len(invoices) and len(keys):
+            stamps = invoices['InvoiceDate']
+            header_day = calendar_features.day_codes(stamps) - first_day
+            header_key = (header_day * 24 + stamps.dt.hour.to_numpy()) * n_countries \
+                + countries.get_indexer(invoices['Country'].astype(object))
+            slot = np.minimum(np.searchsorted(keys, header_key), len(keys) - 1)
+            orders['Invoices'] = np.bincount(slot[keys[slot] == header_key], minlength=len(keys))
+
+        keys, lines, sums = _rollup((country * n_days + day) * n_products + product, n_countries * n_days * n_products, measures)
+        del day, hour, country, product, measures
+        rest, product_code = np.divmod(keys, n_products)
+        country_code, day_code = np.divmod(rest, n_days)
+        product_days = pd.DataFrame({
+            'Country': country_code.astype('int16'),
+            'Day': (day_code + first_day).astype('int32'),
+            'Product': product_code.astype('int32'),
+            'TotalSales': sums['TotalSales'],
+            'Quantity': np.rint(sums['Quantity']).astype('int64'),
+            'Lines': lines.astype('int64'),
+        })
+
+        month = calendar_features.month_codes(product_days['Day'].to_numpy())
+        first_month = int(month.min()) if len(month) else 0
+        n_months = int(month.max()) - first_month + 1 if len(month) else 1
+        month_keys = (country_code * n_months + month - first_month) * n_products + product_code
+        keys, _, sums = _rollup(month_keys, n_countries * n_months * n_products,
+                                {col: product_days[col].to_numpy(dtype='float64') for col in ['TotalSales', 'Quantity', 'Lines']})
+        rest, product_code = np.divmod(keys, n_products)
+        country_code, month_code = np.divmod(rest, n_months)
+        product_months = pd.DataFrame({
+            'Country': country_code.astype('int16'),
+            'Month': (month_code + first_month).astype('int32'),
+            'Product': product_code.astype('int32'),
+            'TotalSales': sums['TotalSales'],
+            'Quantity': np.rint(sums['Quantity']).astype('int64'),
+            'Lines': np.rint(sums['Lines']).astype('int64'),
+        })
+
+        sample = frame.iloc[:PAYLOAD_SAMPLE_ROWS]
+        row_bytes = {col: len(sample[[col]].to_json(orient='values', date_format='iso')) / max(len(sample), 1)
+                     for col in ['Day', 'Month', 'Weekday', 'Hour', 'Country', 'StockCode', 'Description',
+                                 'TotalSales', 'Quantity', 'InvoiceNo'] if col in sample}
+        return cls(orders, product_days, product_months, countries, products, len(frame), row_bytes)
+
+    @classmethod
+    def from_prepared(cls, prepared):
+        invoices = prepared.invoices
+        return cls.build(prepared.non_canceled, invoices[~invoices['Canceled']])
+
+    def date_range(self):
+        return pd.Timestamp(self.first_day, unit='D'), pd.Timestamp(self.last_day, unit='D')
+
+    def _day_bounds(self, start, end):
+        # Day codes [lo, hi) of a date range; end is exclusive
+        lo = self.first_day if start is None else max(int(calendar_features.day_codes(start)), self.first_day)
+        hi = self.last_day + 1 if end is None else min(int(calendar_features.day_codes(end)), self.last_day + 1)
+        return lo, max(hi, lo)
+
+    def _country_codes(self, countries):
+        if not countries:
+            return None
+        codes = self.countries.get_indexer(list(countries))
+        return codes[codes >= 0]  # a country that does not occur selects no rows
+
+    def _order_rows(self, countries, lo, hi):
+        days = self.orders['Day'].to_numpy()
+        rows = self.orders.iloc[np.searchsorted(days, lo):np.searchsorted(days, hi)]
+        codes = self._country_codes(countries)
+        if codes is not None:
+            rows = rows[np.isin(rows['Country'].to_numpy(), codes)]
+        return {col: rows[col].to_numpy() for col in rows}
+
+    def _product_rows(self, countries, lo, hi, by_day):
+        # Column arrays of the product-table rows that make up days [lo, hi)
+        codes = self._country_codes(countries)
+        pieces = []
+        def take(table, offsets, time_col, time_lo, time_hi):
+            rows = table.iloc[_positions(table[time_col].to_numpy(), offsets, codes, time_lo, time_hi)]
+            piece = {col: rows[col].to_numpy() for col in ['Country', 'Product', 'TotalSales', 'Quantity', 'Lines']}
+            piece['Month'] = rows['Month'].to_numpy() if time_col == 'Month' else calendar_features.month_codes(rows['Day'].to_numpy())
+            if by_day:
+                piece['Day'] = rows['Day'].to_numpy()
+            pieces.append(piece)
+
+        month_lo, month_hi = int(calendar_features.month_codes(lo)), int(calendar_features.month_codes(hi))
+        if calendar_features.month_first_days(month_lo) != lo:
+            month_lo += 1  # the month lo falls in is only partly selected
+        if by_day or month_lo >= month_hi:
+            take(self.product_days, self.day_offsets, 'Day', lo, hi)
+        else:
+            take(self.product_days, self.day_offsets, 'Day', lo, int(calendar_features.month_first_days(month_lo)))
+            take(self.product_months, self.month_offsets, 'Month', month_lo, month_hi)
+            take(self.product_days, self.day_offsets, 'Day', int(calendar_features.month_first_days(month_hi)), hi)
+        if len(pieces) == 1:
+            return pieces[0]
+        return {col: np.concatenate([piece[col] for piece in pieces]) for col in pieces[0]}
+
+    def query(self, by, countries=None, start=None, end=None):
+        # Roll the cube up to the dimensions in `by`: any of Day, Month, Weekday, Hour,
+        # Period (calendar codes, as in the prepared frame), Country, StockCode, Description
+        by = list(by)
+        unknown = [dim for dim in by if dim not in TIME_DIMENSIONS + ('Country',) + PRODUCT_DIMENSIONS]
+        if unknown:
+            raise ValueError(f"the sales cube has no dimension {unknown}")
+        product_level = any(dim in PRODUCT_DIMENSIONS for dim in by)
+        if product_level and ('Hour' in by or 'Period' in by):
+            raise ValueError("the sales cube does not break products down by hour")
+        lo, hi = self._day_bounds(start, end)
+        if product_level:
+            table = self._product_rows(countries, lo, hi, by_day='Day' in by or 'Weekday' in by)
+        else:
+            table = self._order_rows(countries, lo, hi)
+            if 'Month' in by:
+                table['Month'] = calendar_features.month_codes(table['Day'])
+
+        axes = []  # (name, codes, cardinality) of every group axis
+        for dim in dict.fromkeys('Product' if dim in PRODUCT_DIMENSIONS else dim for dim in by):
+            if dim == 'Day':
+                axes.append((dim, table['Day'].astype('int64') - self.first_day, self.n_days))
+            elif dim == 'Month':
+                axes.append((dim, table['Month'].astype('int64') - self.first_month, self.n_months))
+            elif dim == 'Weekday':
+                axes.append((dim, calendar_features.weekday_codes(table['Day']).astype('int64'), 7))
+            elif dim == 'Hour':
+                axes.append((dim, table['Hour'].astype('int64'), 24))
+            elif dim == 'Period':
+                axes.append((dim, calendar_features.period_codes(table['Hour']).astype('int64'), len(calendar_features.TIME_PERIODS)))
+            elif dim == 'Country':
+                axes.append((dim, table['Country'].astype('int64'), max(len(self.countries), 1)))
+            else:
+                axes.append((dim, table['Product'].astype('int64'), max(len(self.products), 1)))
+
+        key = np.zeros(len(table['TotalSales']), dtype='int64')
+        n_groups = 1
+        for _, codes, size in axes:
+            key = key * size + codes
+            n_groups *= size
+        measures = [col for col in ('TotalSales', 'Quantity', 'Lines', 'Invoices') if col in table]
+        uniques, _, result = _rollup(key, n_groups, {col: table[col].astype('float64') for col in measures})
+        for col in measures:
+            if col != 'TotalSales':
+                result[col] = np.rint(result[col]).astype('int64')
+
+        labels = {}
+        for name, _, size in reversed(axes):
+            uniques, codes = np.divmod(uniques, size)
+            if name == 'Day':
+                labels[name] = (codes + self.first_day).astype('int32')
+            elif name == 'Month':
+                labels[name] = (codes + self.first_month).astype('int32')
+            elif name in ('Weekday', 'Hour', 'Period'):
+                labels[name] = codes.astype('int8')
+            elif name == 'Country':
+                labels[name] = self.countries.take(codes)
+            else:
+                for col in PRODUCT_DIMENSIONS:
+                    labels[col] = self.products[col].iloc[codes].reset_index(drop=True)
+        return pd.DataFrame({**{dim: labels[dim] for dim in by}, **result})
+
+    def source_bytes(self, columns, rows):
+        # Estimated JSON size of `rows` line items restricted to `columns`
+        return int(rows * sum(self.row_bytes.get(col, 0) for col in columns))
+# End def #
@@ -0,0 +1,56 @@
+import numpy as np
+
+# About one point per horizontal pixel is all a line chart can show
+POINTS_PER_PIXEL = 1.0
+MIN_POINTS = 100
+
+def points_for_width(width_px, points_per_pixel=POINTS_PER_PIXEL):
+    return max(MIN_POINTS, int(width_px * points_per_pixel))
+
+### Definition Largest-Triangle-Three-Buckets ###
+# Keeps the first and last point and, for each bucket in between, the point forming the
+# largest triangle with the previously kept point and the average of the next bucket.
+# Returns row positions so the caller can take any columns it needs.
+def lttb_indices(x, y, n_out):
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    every = (n - 2) / (n_out - 2)
+    edges = (np.floor(np.arange(n_out - 1) * every) + 1).astype('int64')
+    edges = np.append(edges, n)
+    indices = np.empty(n_out, dtype='int64')
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = edges[i + 1], edges[i + 2]
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+    return indices
+# End def #
+
+### Definition min/max bucketing ###
+# Cheaper alternative: the lowest and highest point of each of n_out / 2 buckets.
+def minmax_indices(y, n_out):
+    y = np.asarray(y, dtype='float64')
+    n = len(y)
+    if n_out >= n or n_out < 4:
+        return np.arange(n)
+    buckets = n_out // 2
+    edges = np.linspace(0, n, buckets + 1).astype('int64')
+    bucket = np.repeat(np.arange(buckets), np.diff(edges))
+    # Sort positions by (bucket, value); the first and last entry of each bucket are its min and max
+    order = np.lexsort((y, bucket))
+    picks = np.concatenate([order[edges[:-1]], order[edges[1:] - 1]])
+    return np.unique(picks)
+# End def #
+
+def downsample_indices(x, y, n_out, method='lttb'):
+    if method == 'minmax':
+        return minmax_indices(y, n_out)
+    return lttb_indices(x, y, n_out)
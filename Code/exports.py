@@ -0,0 +1,111 @@
+import gzip
+import hashlib
+import os
+
+import pandas as pd
+
+import frame_cache
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # without pyarrow only gzip CSV is offered
+    pa = None
+
+### Export settings ###
+# Exports are written to disk in CHUNK_ROWS slices, so building one never holds more
+# than a slice of encoded output in memory, and they are kept by key so asking again
+# for the same data and format only reopens the file.
+EXPORT_DIR = os.environ.get('RETAIL_EXPORT_DIR', os.path.join(frame_cache.CACHE_DIR, 'exports'))
+EXPORT_MAX_BYTES = int(os.environ.get('RETAIL_EXPORT_MAX_BYTES', 2**30))
+CHUNK_ROWS = 100_000
+
+FORMATS = {
+    'csv.gz': 'application/gzip',
+    'parquet': 'application/vnd.apache.parquet',
+    'feather': 'application/vnd.apache.arrow.file',
+}
+
+def available_formats():
+    return [fmt for fmt in FORMATS if fmt == 'csv.gz' or pa is not None]
+# End Export settings #
+
+### Definition export keys ###
+def content_key(frame, index=True):
+    # Hash of the values, labels and dtypes; used when the caller has no key of its own
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((list(frame.columns), [str(dtype) for dtype in frame.dtypes], index)).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(frame, index=index).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def export_path(key, fmt, index=True, export_dir=EXPORT_DIR):
+    digest = hashlib.blake2b(f"{key}|{fmt}|{index}".encode('utf-8'), digest_size=16).hexdigest()
+    return os.path.join(export_dir, f"{digest}.{fmt}")
+# End def #
+
+### Definition chunked writers ###
+def _chunks(frame):
+    for start in range(0, max(len(frame), 1), CHUNK_ROWS):
+        yield start, frame.iloc[start:start + CHUNK_ROWS]
+
+def _write_csv_gz(frame, path, index):
+    with gzip.open(path, 'wb', compresslevel=6) as out:
+        for start, chunk in _chunks(frame):
+            out.write(chunk.to_csv(header=start == 0, index=index).encode('utf-8'))
+
+def _record_batches(frame, index):
+    schema = pa.Schema.from_pandas(frame.iloc[:0], preserve_index=index)
+    for _, chunk in _chunks(frame):
+        yield schema, pa.RecordBatch.from_pandas(chunk, schema=schema, preserve_index=index)
+
+def _write_parquet(frame, path, index):
+    writer = None
+    try:
+        for schema, batch in _record_batches(frame, index):
+            writer = writer or pq.ParquetWriter(path, schema, compression='zstd')
+            writer.write_batch(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+
+def _write_feather(frame, path, index):
+    writer = None
+    try:
+        for schema, batch in _record_batches(frame, index):
+            writer = writer or pa.ipc.new_file(path, schema, options=pa.ipc.IpcWriteOptions(compression='zstd'))
+            writer.write_batch(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+
+WRITERS = {'csv.gz': _write_csv_gz, 'parquet': _write_parquet, 'feather': _write_feather}
+
+def write(frame, path, fmt, index=True):
+    # Written under a temporary name and renamed, so `path` is either absent or complete
+    if fmt not in available_formats():
+        raise ValueError(f"unsupported export format {fmt!r}; expected one of {available_formats()}")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        WRITERS[fmt](frame, tmp_path, index)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+# End def #
+
+### Definition cached export ###
+def export(frame, fmt, key=None, index=True, export_dir=EXPORT_DIR, max_bytes=EXPORT_MAX_BYTES):
+    # Returns the path of `frame` written as `fmt`; key identifies the frame's content
+    # (e.g. a pipeline stage key) and defaults to a hash of the frame
+    if fmt not in available_formats():
+        raise ValueError(f"unsupported export format {fmt!r}; expected one of {available_formats()}")
+    path = export_path(key or content_key(frame, index), fmt, index, export_dir)
+    if os.path.exists(path):
+        os.utime(path)  # mtime doubles as the last-access time for LRU eviction
+        return path
+    os.makedirs(export_dir, exist_ok=True)
+    write(frame, path, fmt, index)
+    frame_cache.evict(export_dir, max_bytes, keep=path, suffix=tuple(f".{fmt}" for fmt in FORMATS))
+    return path
+# End def #
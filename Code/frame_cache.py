@@ -0,0 +1,92 @@
+import hashlib
+import io
+import os
+import time
+
+import ingest
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # without pyarrow every load falls back to parsing the CSV
+    pa = None
+
+### Cache settings ###
+# Parsed uploads are kept as uncompressed Arrow IPC (Feather v2) files so they can be
+# memory-mapped on the next load instead of being parsed again.
+CACHE_DIR = os.environ.get('RETAIL_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'retail-dashboard'))
+CACHE_MAX_BYTES = int(os.environ.get('RETAIL_CACHE_MAX_BYTES', 2 * 2**30))
+CACHE_VERSION = '1'
+SUFFIX = '.arrow'
+
+def content_key(data, name='', schema=None):
+    # Keyed on the upload bytes plus everything that changes how they are parsed
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{CACHE_VERSION}|{name}|{schema!r}|".encode('utf-8'))
+    digest.update(data)
+    return digest.hexdigest()
+
+def _path(key, cache_dir):
+    return os.path.join(cache_dir, key + SUFFIX)
+
+### Definition read / write ###
+def load(key, cache_dir=CACHE_DIR):
+    path = _path(key, cache_dir)
+    if pa is None or not os.path.exists(path):
+        return None
+    try:
+        table = feather.read_table(path, memory_map=True)
+    except (OSError, pa.ArrowInvalid):
+        os.remove(path)
+        return None
+    os.utime(path)  # mtime doubles as the last-access time for LRU eviction
+    return table.to_pandas()
+
+def store(key, data, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+    if pa is None:
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    path = _path(key, cache_dir)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    feather.write_feather(data, tmp_path, compression='uncompressed')
+    os.replace(tmp_path, path)
+    evict(cache_dir, max_bytes, keep=path)
+
+def evict(cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, keep=None, suffix=SUFFIX):
+    # Drop least recently used entries until the cache fits in max_bytes
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(suffix) and entry.path != keep:
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    if keep is not None and os.path.exists(keep):
+        total += os.path.getsize(keep)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+# End def #
+
+### Definition cached CSV reader ###
+def read_csv(data, name='', schema=None, chunksize=None, trace_memory=False,
+             cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+    # data is the raw upload bytes; returns (DataFrame, LoadStats) like ingest.read_csv
+    key = content_key(data, name, schema)
+    start = time.perf_counter()
+    cached = load(key, cache_dir)
+    if cached is not None:
+        stats = ingest.LoadStats(rows=len(cached), seconds=time.perf_counter() - start,
+                                 frame_bytes=int(cached.memory_usage(deep=True).sum()), source='cache')
+        return cached, stats
+    frame, stats = ingest.read_csv(io.BytesIO(data), schema=schema, chunksize=chunksize, trace_memory=trace_memory)
+    try:
+        store(key, frame, cache_dir, max_bytes)
+    except (OSError, ValueError, TypeError):
+        pass  # an unwritable cache must never break the dashboard
+    return frame, stats
+# End def #
@@ -0,0 +1,162 @@
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+### Definition CSV schema ###
+# read_dtypes are handed to the CSV parser, casts are applied once per chunk after
+# parsing (CustomerID is stored as "17850.0" in some exports so it is parsed as float
+# and narrowed afterwards), date_columns are read as categoricals and only their
+# distinct values are parsed, once, at read time.
+@dataclass(frozen=True)
+class Schema:
+    read_dtypes: dict
+    casts: dict = field(default_factory=dict)
+    date_columns: tuple = ()
+    date_format: str = None
+
+    @property
+    def columns(self):
+        return list(self.read_dtypes) + [col for col in self.date_columns if col not in self.read_dtypes]
+# End def #
+
+ONLINE_RETAIL_SCHEMA = Schema(
+    read_dtypes={
+        'InvoiceNo': 'str',
+        'StockCode': 'category',
+        'Description': 'category',
+        'Quantity': 'int32',
+        'UnitPrice': 'float32',
+        'CustomerID': 'float64',
+        'Country': 'category',
+        'InvoiceDate': 'category',
+    },
+    casts={'CustomerID': 'Int32'},
+    date_columns=('InvoiceDate',),
+    date_format='%m/%d/%Y %H:%M',
+)
+
+SCHEMAS = {
+    'OnlineRetail.csv': ONLINE_RETAIL_SCHEMA,
+}
+
+def schema_for(file_name):
+    return SCHEMAS.get(file_name)
+
+### Definition load statistics ###
+@dataclass
+class LoadStats:
+    rows: int
+    seconds: float
+    frame_bytes: int
+    peak_bytes: int = None
+    chunks: int = 1
+    source: str = 'csv'
+
+    @property
+    def rows_per_sec(self):
+        return self.rows / self.seconds if self.seconds > 0 else float('inf')
+
+    def __str__(self):
+        text = f"{self.rows:,} rows in {self.seconds:.2f}s ({self.rows_per_sec:,.0f} rows/s), frame {self.frame_bytes / 2**20:,.1f} MB"
+        if self.peak_bytes is not None:
+            text += f", peak {self.peak_bytes / 2**20:,.1f} MB"
+        if self.source != 'csv':
+            text += f" [from {self.source}]"
+        return text
+# End def #
+
+def _to_datetime(values, date_format):
+    try:
+        return pd.to_datetime(values, format=date_format)
+    except (ValueError, TypeError):
+        return pd.to_datetime(values)
+
+def _parse_dates(chunk, schema):
+    for col in schema.date_columns:
+        values = chunk[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Invoice lines share timestamps, so parse each distinct string once
+            parsed = _to_datetime(values.cat.categories, schema.date_format)
+            codes = values.cat.codes.to_numpy()
+            chunk[col] = pd.Series(parsed.take(codes), index=chunk.index).where(codes >= 0)
+        else:
+            chunk[col] = _to_datetime(values, schema.date_format)
+    return chunk
+
+def _finish_chunk(chunk, schema):
+    if schema.casts:
+        chunk = chunk.astype(schema.casts)
+    return _parse_dates(chunk, schema)
+
+def _concat_chunks(chunks):
+    if len(chunks) == 1:
+        return chunks[0]
+    # Plain concat turns categoricals with differing categories back into object columns
+    categorical = [col for col in chunks[0].columns if isinstance(chunks[0][col].dtype, pd.CategoricalDtype)]
+    merged = {col: union_categoricals([chunk[col] for chunk in chunks]) for col in categorical}
+    data = pd.concat([chunk.drop(columns=categorical) for chunk in chunks], ignore_index=True)
+    for col in categorical:
+        data[col] = pd.Categorical(merged[col])
+    return data[chunks[0].columns]
+
+### Definition typed CSV reader ###
+def iter_csv(file, schema=None, chunksize=None, **read_kwargs):
+    # Yields parsed, typed chunks (a single chunk when chunksize is falsy)
+    if hasattr(file, 'seek'):
+        file.seek(0)
+    if schema is not None:
+        read_kwargs.setdefault('usecols', schema.columns)
+        read_kwargs.setdefault('dtype', schema.read_dtypes)
+    if not chunksize:
+        chunk = pd.read_csv(file, **read_kwargs)
+        yield chunk if schema is None else _finish_chunk(chunk, schema)
+        return
+    with pd.read_csv(file, chunksize=chunksize, **read_kwargs) as reader:
+        for chunk in reader:
+            yield chunk if schema is None else _finish_chunk(chunk, schema)
+
+def read_csv(file, schema=None, chunksize=None, trace_memory=False, **read_kwargs):
+    # Returns (DataFrame, LoadStats). trace_memory records the peak of the allocations made
+    # by this load with tracemalloc, which slows parsing down noticeably, so it is opt-in.
+    already_tracing = tracemalloc.is_tracing()
+    if trace_memory:
+        if already_tracing:
+            tracemalloc.reset_peak()
+        else:
+            tracemalloc.start()
+    start = time.perf_counter()
+    peak = None
+    try:
+        chunks = list(iter_csv(file, schema, chunksize, **read_kwargs))
+        data = _concat_chunks(chunks)
+        if trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+    finally:
+        if trace_memory and not already_tracing:
+            tracemalloc.stop()
+    stats = LoadStats(rows=len(data), seconds=time.perf_counter() - start,
+                      frame_bytes=int(data.memory_usage(deep=True).sum()), peak_bytes=peak, chunks=len(chunks))
+    return data, stats
+# End def #
+
+### Definition typed frames ###
+# An already typed frame (e.g. read back from Parquet) cast to what read_csv gives for
+# the same schema: the schema's columns and dtypes, categories sorted and limited to the
+# values present.
+def conform(frame, schema):
+    columns = {}
+    for col in schema.columns:
+        values = frame[col]
+        dtype = schema.casts.get(col, schema.read_dtypes.get(col))
+        if col in schema.date_columns:
+            columns[col] = values if pd.api.types.is_datetime64_any_dtype(values) else _to_datetime(values, schema.date_format)
+        elif dtype == 'category':
+            values = values.cat.remove_unused_categories() if isinstance(values.dtype, pd.CategoricalDtype) else values.astype('category')
+            columns[col] = values.cat.set_categories(sorted(values.cat.categories))
+        else:
+            columns[col] = values.astype(dtype)
+    return pd.DataFrame(columns, index=frame.index)
+# End def #
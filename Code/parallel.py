@@ -0,0 +1,116 @@
+import atexit
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_WORKERS = int(os.environ.get('RETAIL_WORKERS', 1))
+# Below this many rows the pool start-up and partitioning cost more than they save
+MIN_PARALLEL_ROWS = 200_000
+
+### Definition shared-memory columns ###
+# Columns travel to the workers as shared-memory buffers, not pickled copies. Each column
+# is described by a small spec: the buffers it needs plus whatever (categories, uniques,
+# dtype) is required to rebuild the same pandas dtype on the other side.
+def _share(array, blocks):
+    array = np.ascontiguousarray(array)
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, array.dtype, buffer=block.buf)[:] = array
+    blocks.append(block)
+    return (block.name, array.shape, array.dtype.str)
+
+def _share_column(series, blocks):
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        return ('category', _share(series.cat.codes.to_numpy(), blocks), dtype)
+    if isinstance(series.array, (pd.arrays.IntegerArray, pd.arrays.FloatingArray, pd.arrays.BooleanArray)):
+        values = series.to_numpy(dtype=dtype.numpy_dtype, na_value=0)
+        return ('masked', _share(values, blocks), _share(series.isna().to_numpy(), blocks), dtype)
+    if dtype.kind in 'biufmM':
+        return ('numpy', _share(series.to_numpy(), blocks), dtype)
+    # Strings and other objects: share the factorized codes, pickle only the distinct values
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    return ('factorized', _share(codes, blocks), uniques.array)
+
+def _attach(spec, opened):
+    name, shape, dtype = spec
+    block = shared_memory.SharedMemory(name=name)
+    opened.append(block)
+    return np.ndarray(shape, np.dtype(dtype), buffer=block.buf)
+
+def _rebuild(spec, rows, opened):
+    kind = spec[0]
+    if kind == 'category':
+        return pd.Categorical.from_codes(_attach(spec[1], opened)[rows], dtype=spec[2])
+    if kind == 'masked':
+        values, mask = _attach(spec[1], opened)[rows], _attach(spec[2], opened)[rows]
+        return spec[3].construct_array_type()(values, mask)
+    if kind == 'numpy':
+        return _attach(spec[1], opened)[rows]
+    return spec[2].take(_attach(spec[1], opened)[rows], allow_fill=True)
+# End def #
+
+### Definition worker ###
+def _aggregate_partition(columns, rows_spec, start, stop, by, spec):
+    opened = []
+    try:
+        rows = _attach(rows_spec, opened)[start:stop].copy()  # no views may outlive the blocks
+        frame = pd.DataFrame({col: _rebuild(col_spec, rows, opened) for col, col_spec in columns.items()})
+        return frame.groupby(by, observed=True, sort=True).agg(spec)
+    finally:
+        for block in opened:
+            block.close()
+# End def #
+
+_pools = {}
+
+def _pool(workers):
+    if workers not in _pools:
+        _pools[workers] = ProcessPoolExecutor(max_workers=workers)
+    return _pools[workers]
+
+@atexit.register
+def _shutdown_pools():
+    for pool in _pools.values():
+        pool.shutdown(cancel_futures=True)
+
+### Definition parallel groupby ###
+def groupby_agg(df, by, spec, workers=None, as_index=True):
+    # df.groupby(by, as_index=as_index, observed=True, sort=True).agg(spec), computed
+    # over hash partitions of the group key in a process pool. Every group lands in
+    # exactly one partition and keeps its row order, so any aggregation is exact and the
+    # result is identical to the serial call.
+    by = [by] if isinstance(by, str) else list(by)
+    workers = workers or DEFAULT_WORKERS
+    if workers <= 1 or len(df) < MIN_PARALLEL_ROWS:
+        return df.groupby(by, as_index=as_index, observed=True, sort=True).agg(spec)
+
+    needed = list(dict.fromkeys(by + list(spec)))
+    partition = pd.util.hash_pandas_object(df[by], index=False).to_numpy() % np.uint64(workers)
+    order = np.argsort(partition, kind='stable')  # row order is kept inside each partition
+    bounds = np.searchsorted(partition[order], np.arange(workers + 1, dtype='uint64'))
+
+    blocks = []
+    try:
+        columns = {col: _share_column(df[col], blocks) for col in needed}
+        rows_spec = _share(order, blocks)
+        futures = [_pool(workers).submit(_aggregate_partition, columns, rows_spec, bounds[i], bounds[i + 1], by, spec)
+                   for i in range(workers) if bounds[i + 1] > bounds[i]]
+        parts = [future.result() for future in futures]
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    result = pd.concat(parts).sort_index(kind='stable')
+    if not as_index:
+        # as_index=False puts the keys back as columns, except a key that was itself
+        # aggregated (e.g. {'StockCode': 'count'}), whose column holds the aggregate
+        keys = [key for key in by if key not in result.columns]
+        if keys:
+            result = result.reset_index(level=keys)
+        result = result.reset_index(drop=True)
+    return result
+# End def #
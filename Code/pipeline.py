@@ -0,0 +1,76 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import pandas as pd
+
+DEFAULT_MAX_ENTRIES = 64
+
+### Definition stage nodes ###
+# A Node is a stage result plus the key it was cached under. A stage's key is derived
+# from its name, its own parameters and the keys of the nodes it consumes, so a change
+# anywhere upstream changes every key below it and nothing else. Cached values are
+# shared between reruns and sessions: stages must not modify their inputs.
+@dataclass(frozen=True, eq=False)
+class Node:
+    name: str
+    key: str
+    value: object
+# End def #
+
+@dataclass
+class StageStats:
+    hits: int = 0
+    misses: int = 0
+    seconds: float = 0.0  # time spent computing on misses
+
+def stage_key(name, upstream_keys, params):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((name, tuple(upstream_keys), sorted(params.items()))).encode('utf-8'))
+    return digest.hexdigest()
+
+### Definition memoized stage pipeline ###
+class Pipeline:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.results = OrderedDict()
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def _lookup(self, name, key, compute):
+        with self._lock:
+            stats = self.stats.setdefault(name, StageStats())
+            if key in self.results:
+                self.results.move_to_end(key)
+                stats.hits += 1
+                return Node(name, key, self.results[key])
+        start = time.perf_counter()
+        value = compute()
+        with self._lock:
+            stats.misses += 1
+            stats.seconds += time.perf_counter() - start
+            self.results[key] = value
+            while len(self.results) > self.max_entries:
+                self.results.popitem(last=False)
+        return Node(name, key, value)
+
+    def source(self, name, content_key, load, **params):
+        # Root stage: keyed on a content hash of its input (e.g. the upload bytes)
+        return self._lookup(name, stage_key(name, [content_key], params), lambda: load(**params))
+
+    def stage(self, name, func, *inputs, **params):
+        # func(*input values, **params); params must have a stable repr
+        key = stage_key(name, [node.key for node in inputs], params)
+        return self._lookup(name, key, lambda: func(*[node.value for node in inputs], **params))
+
+    def stats_table(self):
+        with self._lock:
+            rows = [(name, stats.hits, stats.misses, stats.seconds) for name, stats in self.stats.items()]
+        return pd.DataFrame(rows, columns=['stage', 'hits', 'misses', 'seconds']).set_index('stage')
+
+    def clear(self):
+        with self._lock:
+            self.results.clear()
+# End def #
@@ -0,0 +1,123 @@
+from dataclasses import dataclass
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+import calendar_features
+
+### Definition cancellation flag ###
+# An invoice code starting with 'C' marks a cancellation. For categorical codes only the
+# distinct values are checked; rows pick their flag up through the category codes.
+CANCEL_PREFIX = ('C', 'c')
+
+def cancellation_mask(invoice_no):
+    if isinstance(invoice_no.dtype, pd.CategoricalDtype):
+        flags = np.append(invoice_no.cat.categories.astype(str).str.startswith(CANCEL_PREFIX), False)
+        return flags[invoice_no.cat.codes.to_numpy()]  # code -1 (missing) picks the trailing False
+    if pd.api.types.is_numeric_dtype(invoice_no):
+        return np.zeros(len(invoice_no), dtype=bool)
+    return invoice_no.str.startswith(CANCEL_PREFIX, na=False).to_numpy(dtype=bool)
+# End def #
+
+### Definition decimal prices ###
+# UnitPrice is read as float32 (ingest.ONLINE_RETAIL_SCHEMA), which holds 2.55 as
+# 2.5499999523. Before prices are clipped or multiplied, each float32 price becomes the
+# shortest decimal that reads back as the same float32 (its repr, "2.55"), converted
+# once per distinct price, so clip bounds and totals are those of a float64 load.
+# Prices that are already float64 are only passed through.
+def decimal_prices(prices):
+    values = np.asarray(prices)
+    if values.dtype != np.float32:
+        return values.astype('float64')
+    codes, distinct = pd.factorize(values, use_na_sentinel=False)
+    return distinct.astype(str).astype('float64')[codes]
+# End def #
+
+### Definition prepared transactions ###
+# Everything the dashboard derives per row is computed here once per upload:
+#   TotalSales  Quantity * UnitPrice, see decimal_prices
+#   Canceled    invoice is a cancellation
+#   Day, Month, Hour, Weekday, Period
+#               calendar codes, see calendar_features.calendar_codes
+# Charts group on the integer codes and only turn them into labels for display.
+# Rows are stored non-canceled first, so both views are positional slices of the same
+# frame rather than boolean-mask copies.
+@dataclass
+class PreparedTransactions:
+    frame: pd.DataFrame
+    n_non_canceled: int
+
+    @property
+    def canceled(self):
+        return self.frame.iloc[self.n_non_canceled:]
+
+    @property
+    def non_canceled(self):
+        return self.frame.iloc[:self.n_non_canceled]
+
+    @property
+    def max_year(self):
+        return int(self.frame['InvoiceDate'].max().year)
+
+    @cached_property
+    def daily(self):
+        return daily_rollup(self.frame)
+
+    @cached_property
+    def invoices(self):
+        return invoice_headers(self.frame)
+# End def #
+
+def prepare_transactions(data):
+    frame = data.dropna().drop_duplicates()
+    if not pd.api.types.is_datetime64_any_dtype(frame['InvoiceDate']):
+        frame['InvoiceDate'] = pd.to_datetime(frame['InvoiceDate'])
+    canceled = cancellation_mask(frame['InvoiceNo'])
+    order = np.argsort(canceled, kind='stable')
+    if not (order[1:] > order[:-1]).all():
+        frame, canceled = frame.iloc[order], canceled[order]
+    frame = frame.assign(
+        TotalSales=frame['Quantity'] * decimal_prices(frame['UnitPrice']),
+        Canceled=canceled,
+        **calendar_features.calendar_codes(frame['InvoiceDate']),
+    )
+    return PreparedTransactions(frame, int(len(canceled) - canceled.sum()))
+
+### Definition daily rollup ###
+# One row per calendar day (Day code) between the first and last transaction, days
+# without trade included as zeros, so "the last 30 days" is a positional slice:
+#   sales           TotalSales of every row (cancellations count negative)
+#   canceled_sales  TotalSales of the canceled rows
+#   members         distinct customers seen up to and including the day
+def daily_rollup(frame):
+    days = frame['Day'].to_numpy()
+    first = int(days.min())
+    n_days = int(days.max()) - first + 1
+    offset = days - first
+    total = frame['TotalSales'].to_numpy(dtype='float64')
+    sales = np.bincount(offset, weights=total, minlength=n_days)
+    canceled_sales = np.bincount(offset, weights=np.where(frame['Canceled'].to_numpy(), total, 0.0), minlength=n_days)
+    first_seen = frame.groupby('CustomerID', observed=True)['Day'].min().to_numpy() - first
+    members = np.cumsum(np.bincount(first_seen, minlength=n_days))
+    return pd.DataFrame({'sales': sales, 'canceled_sales': canceled_sales, 'members': members},
+                        index=pd.RangeIndex(first, first + n_days, name='Day'))
+# End def #
+
+### Definition invoice headers ###
+# One row per (CustomerID, InvoiceNo), sorted on that key: the invoice-level facts that
+# orders-per-country, the invoice summary and RFM frequency need, at a fraction of the
+# line-item row count.
+INVOICE_COLUMNS = ['InvoiceNo', 'CustomerID', 'Country', 'InvoiceDate', 'Lines', 'Quantity', 'TotalSales', 'Canceled']
+
+def invoice_headers(frame):
+    headers = frame.groupby(['CustomerID', 'InvoiceNo'], sort=True, observed=True).agg(
+        Country=('Country', 'first'),
+        InvoiceDate=('InvoiceDate', 'max'),
+        Lines=('InvoiceNo', 'size'),
+        Quantity=('Quantity', 'sum'),
+        TotalSales=('TotalSales', 'sum'),
+        Canceled=('Canceled', 'max'),
+    )
+    return headers.reset_index()[INVOICE_COLUMNS]
+# End def #
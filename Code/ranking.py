@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+
+### Definition top-N selection ###
+# The same rows as Series.nlargest(n, keep='first'), without sorting everything:
+# argpartition finds the n-th largest value of every measure at once, and only the
+# values at or above it are sorted (ties keep the earlier position, NaN ranks last).
+def top_positions(values, n):
+    # values: 1-D array, or 2-D with one measure per row -> positions, largest first
+    values = np.asarray(values, dtype='float64')
+    if values.ndim == 1:
+        return top_positions(values[np.newaxis], n)[0]
+    missing = np.isnan(values)
+    ranked = np.where(missing, -np.inf, values)
+    if 0 < n < values.shape[1]:
+        kth = ranked[np.arange(len(ranked)), np.argpartition(ranked, -n, axis=1)[:, -n]]
+    else:
+        kth = np.full(len(values), -np.inf)
+    result = []
+    for row, threshold, row_missing in zip(ranked, kth, missing):
+        candidates = np.flatnonzero(row >= threshold) if n > 0 else np.empty(0, dtype='int64')
+        order = np.lexsort((candidates, -row[candidates], row_missing[candidates]))
+        result.append(candidates[order[:n]])
+    return result
+# End def #
+
+### Definition incremental leaderboard ###
+# Running per-item totals of additive measures (sums of columns, row counts are a sum
+# of ones), keyed on `keys` and optionally partitioned by one more column (e.g.
+# Country or Month). Like streaming.RFMState it is fed with update(chunk) as
+# transactions arrive. The leaders it has handed out are kept and maintained: when a
+# chunk only adds to the measure, the new top n is among the old leaders and the items
+# the chunk touched, so only those are re-ranked; a decrease inside the current
+# leaders (cancellations) re-ranks the partition in full.
+class Leaderboard:
+    def __init__(self, keys, measures, by=None):
+        self.keys = list(keys)
+        self.measures = list(measures)
+        self.by = by
+        self.slots = {}  # (partition, *keys) -> slot
+        self.labels = []
+        self.partitions = np.empty(0, dtype='int64')
+        self.partition_codes = {}
+        self.totals = np.zeros((len(self.measures), 0))
+        self.leaders = {}  # (measure, partition code, n) -> slots, largest first
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _grow(self, size):
+        capacity = self.totals.shape[1]
+        if size > capacity:
+            capacity = max(size, 2 * capacity, 1024)
+            self.totals = np.pad(self.totals, ((0, 0), (0, capacity - self.totals.shape[1])))
+            self.partitions = np.pad(self.partitions, (0, capacity - len(self.partitions)), constant_values=-1)
+
+    def update(self, chunk):
+        columns = ([self.by] if self.by else []) + self.keys
+        grouped = chunk.groupby(columns, observed=True, sort=False)[self.measures].sum()
+        if grouped.empty:
+            return 0
+        slots = np.empty(len(grouped), dtype='int64')
+        for i, label in enumerate(grouped.index):
+            label = label if isinstance(label, tuple) else (label,)
+            slot = self.slots.get(label)
+            if slot is None:
+                slot = self.slots[label] = len(self.labels)
+                self.labels.append(label)
+                self._grow(len(self.labels))
+                self.partitions[slot] = self.partition_codes.setdefault(label[0], len(self.partition_codes)) if self.by else 0
+            slots[i] = slot
+        delta = grouped.to_numpy(dtype='float64').T
+        self.totals[:, slots] += delta  # slots are distinct: one row per group
+        self._maintain(slots, delta)
+        return len(slots)
+
+    def merge(self, other):
+        missing = [measure for measure in self.measures if measure not in other.measures]
+        if missing or other.keys != self.keys or other.by != self.by:
+            raise ValueError(f"cannot merge leaderboards with different keys or measures {missing}")
+        self.update(other.frame())
+        return self
+
+    def _maintain(self, slots, delta):
+        for (measure, code, n), leaders in list(self.leaders.items()):
+            row = self.measures.index(measure)
+            in_partition = self.partitions[slots] == code if self.by else np.ones(len(slots), dtype=bool)
+            touched, change = slots[in_partition], delta[row][in_partition]
+            if (change[np.isin(touched, leaders)] < 0).any():
+                del self.leaders[(measure, code, n)]
+                continue
+            candidates = np.union1d(leaders, touched)  # sorted, so ties still keep the earlier slot
+            self.leaders[(measure, code, n)] = candidates[top_positions(self.totals[row, candidates], n)]
+
+    def _partition_code(self, partition):
+        if not self.by:
+            if partition is not None:
+                raise ValueError("this leaderboard is not partitioned")
+            return 0
+        if partition is None:
+            raise ValueError(f"this leaderboard is partitioned by {self.by}: pass a partition")
+        return self.partition_codes.get(partition, -1)
+
+    def top(self, n, measures=None, partition=None):
+        # {measure: frame of the n leading items, largest first} for every measure at once
+        measures = list(measures or self.measures)
+        code = self._partition_code(partition)
+        missing = [measure for measure in measures if (measure, code, n) not in self.leaders]
+        if missing:
+            if self.by:
+                members = np.flatnonzero(self.partitions[:len(self.labels)] == code)
+            else:
+                members = np.arange(len(self.labels))
+            rows = [self.measures.index(measure) for measure in missing]
+            for measure, positions in zip(missing, top_positions(self.totals[rows][:, members], n)):
+                self.leaders[(measure, code, n)] = members[positions]
+        return {measure: self.frame(self.leaders[(measure, code, n)]) for measure in measures}
+
+    def frame(self, slots=None):
+        slots = np.arange(len(self.labels)) if slots is None else np.asarray(slots, dtype='int64')
+        columns = ([self.by] if self.by else []) + self.keys
+        labels = pd.DataFrame([self.labels[slot] for slot in slots], columns=columns)
+        totals = pd.DataFrame(self.totals[:, slots].T, columns=self.measures)
+        return pd.concat([labels, totals], axis=1)
+# End def #
@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+
+import parallel
+
+RFM_COLUMNS = ['recency', 'frequency', 'monetary']
+
+### Definition RFM table ###
+# recency   = days between fix_date (latest invoice by default) and the customer's last invoice
+# frequency = number of distinct invoices
+# monetary  = sum of TotalPrice
+# Built from one groupby with built-in reductions; the day arithmetic runs on the
+# aggregated datetime column instead of once per customer in Python.
+# With `invoices` (prepare.invoice_headers) the last date and invoice count come from
+# the header table and only monetary is summed over the line items. The headers are
+# built from complete rows only (prepare drops rows with a missing value), so they are
+# used only when the line items have no missing values and cover every customer;
+# otherwise the line-item path runs.
+def rfm_table(df, fix_date=None, customer_col='CustomerID', date_col='InvoiceDate',
+              invoice_col='InvoiceNo', price_col='TotalPrice', workers=None, invoices=None):
+    if fix_date is None:
+        fix_date = df[date_col].max()
+    if invoices is not None and not df.isna().any().any():
+        monetary = parallel.groupby_agg(df, customer_col, {price_col: 'sum'}, workers)[price_col]
+        headers = invoices.groupby(customer_col, sort=True).agg(last_date=(date_col, 'max'), frequency=(invoice_col, 'size'))
+        if monetary.index.isin(headers.index).all():
+            headers = headers.reindex(monetary.index)
+            rfm = pd.DataFrame({'recency': headers['last_date'], 'frequency': headers['frequency'], 'monetary': monetary})
+            rfm['recency'] = recency_days(fix_date, rfm['recency'])
+            return rfm
+    rfm = parallel.groupby_agg(df, customer_col, {date_col: 'max', invoice_col: 'nunique', price_col: 'sum'}, workers)
+    rfm.columns = RFM_COLUMNS
+    rfm['recency'] = recency_days(fix_date, rfm['recency'])
+    return rfm
+
+def recency_days(fix_date, last_dates):
+    # Whole days, floored like Timedelta.days
+    return (pd.Timestamp(fix_date) - last_dates).dt.days.astype('int64')
+# End def #
+
+### Segment rules ###
+# One row per (RecencyScore, FMScore) cell of the 5x5 score grid. Cells that are not
+# listed get DEFAULT_SEGMENT. A different table can be loaded from a CSV with the
+# columns RecencyScore, FMScore, Segment (see load_segment_table).
+DEFAULT_SEGMENT = "Don't have segment label"
+SEGMENT_RULES = {
+    "Champion": ['54', '55'],
+    "Recent User": ['52'],
+    "Price Sensitive": ['51'],
+    "Potential Loyalist": ['42', '43', '53'],
+    "Promising": ['41'],
+    "Loyal Customer": ['34', '35', '44', '45'],
+    "Needs Attention": ['33'],
+    "About to Sleep": ['31', '32'],
+    "Can't Lose Them": ['15', '25'],
+    "Hibernating": ['13', '14', '23', '24'],
+    "Lost": ['11', '12', '21', '22'],
+}
+
+def segment_table(rules=SEGMENT_RULES):
+    rows = [(int(score[0]), int(score[1]), segment) for segment, scores in rules.items() for score in scores]
+    return pd.DataFrame(rows, columns=['RecencyScore', 'FMScore', 'Segment'])
+
+def load_segment_table(path):
+    return pd.read_csv(path, dtype={'RecencyScore': 'int8', 'FMScore': 'int8', 'Segment': str})
+
+### Definition segment lookup ###
+class SegmentLookup:
+    def __init__(self, table=None):
+        table = segment_table() if table is None else table
+        duplicated = table.duplicated(['RecencyScore', 'FMScore'], keep=False)
+        if duplicated.any():
+            cells = sorted({f"{r}{fm}" for r, fm in table.loc[duplicated, ['RecencyScore', 'FMScore']].itertuples(index=False)})
+            raise ValueError(f"Segment table assigns more than one segment to score(s) {', '.join(cells)}")
+        outside = ~table['RecencyScore'].between(1, 5) | ~table['FMScore'].between(1, 5)
+        if outside.any():
+            raise ValueError("Segment table scores must be between 1 and 5")
+        # Alphabetical categories keep groupby output in the same order as the string labels had
+        self.categories = sorted(set(table['Segment']) | {DEFAULT_SEGMENT})
+        codes = {segment: code for code, segment in enumerate(self.categories)}
+        self.grid = np.full((5, 5), codes[DEFAULT_SEGMENT], dtype='int8')
+        self.grid[table['RecencyScore'] - 1, table['FMScore'] - 1] = table['Segment'].map(codes).to_numpy()
+
+    def __call__(self, recency_score, fm_score):
+        # Scores are 1..5, so (R - 1) * 5 + (FM - 1) indexes the flattened grid
+        cells = np.asarray(recency_score) * 5 + np.asarray(fm_score) - 6
+        return pd.Categorical.from_codes(self.grid.ravel()[cells], self.categories, validate=False)
+# End def #
+
+### Definition RFM scores ###
+def rfm_scores(df, lookup=None):
+    lookup = lookup or SegmentLookup()
+    RFM_data = df[RFM_COLUMNS].copy()
+    # qcut codes are 0..4; recency is reversed so the most recent customers score 5
+    RFM_data['RecencyScore'] = (5 - pd.qcut(RFM_data['recency'], 5, labels=False)).astype('int8')
+    RFM_data['FrequencyScore'] = (pd.qcut(RFM_data['frequency'].rank(method='first'), 5, labels=False) + 1).astype('int8')
+    RFM_data['MonetaryScore'] = (pd.qcut(RFM_data['monetary'], 5, labels=False) + 1).astype('int8')
+    # ceil((F + M) / 2) in integer arithmetic
+    RFM_data['FMScore'] = ((RFM_data['FrequencyScore'] + RFM_data['MonetaryScore'] + 1) // 2).astype('int8')
+    RFM_data['RFMScore'] = (RFM_data['RecencyScore'] * 10 + RFM_data['FMScore']).astype('int8')
+    RFM_data['Segment'] = lookup(RFM_data['RecencyScore'], RFM_data['FMScore'])
+    return RFM_data
+
+def segment_summary(RFM_data):
+    return RFM_data.groupby('Segment', observed=True).agg(
+        Recency_Avg=('recency', 'mean'),
+        Frequency_Avg=('frequency', 'mean'),
+        Monetary_Avg=('monetary', 'mean'),
+        Segment_Size=('Segment', 'count')
+    ).reset_index()
+
+def segment_counts(RFM_data):
+    return RFM_data.groupby('Segment', observed=True)['Segment'].count()
+# End def #
@@ -0,0 +1,135 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import clipping
+import prepare
+import rfm
+
+STORE_DIR = os.environ.get('RFM_STORE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'retail-dashboard', 'rfm-store'))
+STORE_VERSION = 1
+
+### Definition invoice keys ###
+def invoice_keys(df):
+    # One uint64 per (customer, invoice): lets a delta skip invoices the store already holds
+    keys = pd.util.hash_pandas_object(df[['CustomerID', 'InvoiceNo']].astype({'InvoiceNo': str}), index=False)
+    return keys.to_numpy()
+
+def _customer_rows(df):
+    return df[df['CustomerID'].notnull()].assign(UnitPrice=lambda rows: prepare.decimal_prices(rows['UnitPrice']))
+
+def _cleanse(df, bounds):
+    df = _customer_rows(df)
+    quantity = df['Quantity'].to_numpy(dtype='float64').clip(*bounds['Quantity'])
+    price = df['UnitPrice'].to_numpy(dtype='float64').clip(*bounds['UnitPrice'])
+    return df[['CustomerID', 'InvoiceNo', 'InvoiceDate']].assign(TotalPrice=quantity * price)
+# End def #
+
+### Definition persisted per-customer RFM state ###
+# customers: CustomerID -> last_date, frequency, monetary
+# invoices:  sorted uint64 keys of every (customer, invoice) already counted
+# Recency is not stored; it is derived from last_date when the table is read, so moving
+# the reference date (fixDate) costs one vectorised subtraction instead of a rescan.
+# The outlier clipping bounds are frozen when the store is built; rebuild the store to
+# re-derive them from the full history.
+# source identifies the history the store was built from (e.g. the upload's content
+# key), so a store is never read back for a different dataset.
+class RFMStore:
+    def __init__(self, customers, invoices, fix_date, bounds, path=STORE_DIR, source=None):
+        self.customers = customers
+        self.invoices = invoices
+        self.fix_date = fix_date
+        self.bounds = bounds
+        self.path = path
+        self.source = source
+
+    @classmethod
+    def build(cls, transactions, path=STORE_DIR, source=None):
+        customer_rows = _customer_rows(transactions)
+        bounds = clipping.clip_bounds(customer_rows)
+        cleaned = _cleanse(customer_rows, bounds)
+        grouped = cleaned.groupby('CustomerID', sort=True)
+        customers = pd.DataFrame({
+            'last_date': grouped['InvoiceDate'].max(),
+            'frequency': grouped['InvoiceNo'].nunique().astype('int64'),
+            'monetary': grouped['TotalPrice'].sum(),
+        })
+        store = cls(customers, np.unique(invoice_keys(cleaned)), cleaned['InvoiceDate'].max(), bounds, path, source)
+        store.save()
+        return store
+
+    @classmethod
+    def open(cls, path=STORE_DIR):
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as meta_file:
+            meta = json.load(meta_file)
+        if meta['version'] != STORE_VERSION:
+            raise ValueError(f"RFM store at {path} has version {meta['version']}, expected {STORE_VERSION}; rebuild it")
+        customers = pd.read_parquet(os.path.join(path, 'customers.parquet'))
+        invoices = np.load(os.path.join(path, 'invoices.npy'))
+        bounds = {col: tuple(limits) for col, limits in meta['bounds'].items()}
+        return cls(customers, invoices, pd.Timestamp(meta['fix_date']), bounds, path, meta.get('source'))
+
+    @classmethod
+    def exists(cls, path=STORE_DIR):
+        return os.path.exists(os.path.join(path, 'meta.json'))
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        # Write everything next to the live files first, then swap, so a crash never
+        # leaves a store whose parts disagree
+        self.customers.to_parquet(os.path.join(self.path, 'customers.parquet.tmp'))
+        np.save(os.path.join(self.path, 'invoices.tmp.npy'), self.invoices)
+        with open(os.path.join(self.path, 'meta.json.tmp'), 'w', encoding='utf-8') as meta_file:
+            json.dump({'version': STORE_VERSION, 'fix_date': self.fix_date.isoformat(), 'source': self.source,
+                       'bounds': {col: [float(lo), float(hi)] for col, (lo, hi) in self.bounds.items()}}, meta_file)
+        os.replace(os.path.join(self.path, 'customers.parquet.tmp'), os.path.join(self.path, 'customers.parquet'))
+        os.replace(os.path.join(self.path, 'invoices.tmp.npy'), os.path.join(self.path, 'invoices.npy'))
+        os.replace(os.path.join(self.path, 'meta.json.tmp'), os.path.join(self.path, 'meta.json'))
+
+    def apply_delta(self, delta):
+        # Folds a frame of new transactions in; only the customers it mentions are touched.
+        # Lines of invoices the store already holds are skipped, so applying the same delta
+        # twice changes nothing (an invoice is expected to arrive whole, in one delta).
+        cleaned = _cleanse(delta, self.bounds)
+        keys = invoice_keys(cleaned)
+        if len(self.invoices) and len(keys):
+            position = np.minimum(np.searchsorted(self.invoices, keys), len(self.invoices) - 1)
+            fresh = self.invoices[position] != keys
+            cleaned, keys = cleaned[fresh], keys[fresh]
+        if cleaned.empty:
+            return 0
+        new_keys, first = np.unique(keys, return_index=True)
+        new_invoices = cleaned.iloc[first]
+
+        grouped = cleaned.groupby('CustomerID', sort=True)
+        last_date = grouped['InvoiceDate'].max()
+        monetary = grouped['TotalPrice'].sum()
+        frequency = new_invoices.groupby('CustomerID').size().reindex(last_date.index, fill_value=0)
+
+        known = last_date.index.isin(self.customers.index)
+        existing = last_date.index[known]
+        current = self.customers.loc[existing]
+        self.customers.loc[existing, 'last_date'] = np.maximum(current['last_date'].to_numpy(), last_date[existing].to_numpy())
+        self.customers.loc[existing, 'frequency'] = current['frequency'].to_numpy() + frequency[existing].to_numpy()
+        self.customers.loc[existing, 'monetary'] = current['monetary'].to_numpy() + monetary[existing].to_numpy()
+        added = last_date.index[~known]
+        if len(added):
+            self.customers = pd.concat([self.customers, pd.DataFrame({
+                'last_date': last_date[added],
+                'frequency': frequency[added].astype('int64'),
+                'monetary': monetary[added],
+            })]).sort_index()
+
+        self.invoices = np.union1d(self.invoices, new_keys)
+        self.fix_date = max(self.fix_date, cleaned['InvoiceDate'].max())
+        return len(last_date)
+
+    def rfm_table(self, fix_date=None):
+        # Same layout as CleansingData's output
+        table = self.customers.rename(columns={'last_date': 'recency'})[rfm.RFM_COLUMNS].copy()
+        table.index = table.index.astype('Int32')
+        table['recency'] = rfm.recency_days(fix_date if fix_date is not None else self.fix_date, table['recency'])
+        return table
+# End def #
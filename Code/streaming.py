@@ -0,0 +1,145 @@
+import numpy as np
+import pandas as pd
+
+import ingest
+import prepare
+import rfm
+from clipping import CLIP_COLUMNS, CLIP_QUANTILES, QuantileSketch, iqr_limits
+
+DEFAULT_MEMORY_LIMIT = 2 * 2**30
+# Rough in-flight cost of one parsed CSV row (raw text, parser buffers, typed columns)
+ROW_BYTES_ESTIMATE = 400
+# Invoice pairs are kept as (int32 customer, uint64 invoice hash) plus pandas overhead
+PAIR_BYTES = 24
+
+### Definition helpers ###
+def quantiles_from_counts(counts, qs):
+    # Same linear interpolation as np.quantile, from a value -> count table
+    counts = counts.sort_index()
+    values = counts.index.to_numpy(dtype='float64')
+    ends = np.cumsum(counts.to_numpy())
+    n = ends[-1]
+    result = []
+    for q in qs:
+        h = (n - 1) * q
+        lo = int(np.floor(h))
+        hi = min(lo + 1, n - 1)
+        x_lo = values[np.searchsorted(ends, lo, side='right')]
+        x_hi = values[np.searchsorted(ends, hi, side='right')]
+        result.append(x_lo + (h - lo) * (x_hi - x_lo))
+    return result
+
+def chunksize_for(memory_limit):
+    # Leave half of the budget for the per-customer state
+    return max(10_000, int(memory_limit // 2 // ROW_BYTES_ESTIMATE))
+# End def #
+
+### Definition per-customer partial state ###
+# Mergeable: last invoice date is a max, monetary a sum and the distinct invoices a
+# de-duplicated set of (customer, invoice hash) pairs, so chunks can be folded in any order.
+class RFMState:
+    def __init__(self, memory_limit=DEFAULT_MEMORY_LIMIT):
+        self.memory_limit = memory_limit
+        self.last_date = pd.Series(dtype='datetime64[ns]')
+        self.monetary = pd.Series(dtype='float64')
+        self.pairs = []
+        self.pending_pairs = 0
+        self.stored_pairs = 0
+        self.fix_date = None
+
+    def update(self, chunk):
+        grouped = chunk.groupby('CustomerID', sort=False)
+        self.last_date = _combine(self.last_date, grouped['InvoiceDate'].max(), np.maximum)
+        self.monetary = _combine(self.monetary, grouped['TotalPrice'].sum(), np.add)
+        chunk_max = chunk['InvoiceDate'].max()
+        if self.fix_date is None or chunk_max > self.fix_date:
+            self.fix_date = chunk_max
+        pairs = pd.DataFrame({
+            'CustomerID': chunk['CustomerID'].to_numpy(dtype='int32'),
+            'Invoice': pd.util.hash_array(chunk['InvoiceNo'].astype(str).to_numpy(dtype=object)),
+        }).drop_duplicates()
+        self.pairs.append(pairs)
+        self.pending_pairs += len(pairs)
+        if (self.stored_pairs + self.pending_pairs) * PAIR_BYTES > self.memory_limit // 2:
+            self.compact()
+
+    def compact(self):
+        merged = pd.concat(self.pairs, ignore_index=True).drop_duplicates()
+        self.pairs = [merged]
+        self.stored_pairs = len(merged)
+        self.pending_pairs = 0
+        if self.stored_pairs * PAIR_BYTES > self.memory_limit // 2:
+            raise MemoryError(
+                f"{self.stored_pairs:,} distinct customer invoices do not fit in a {self.memory_limit / 2**20:,.0f} MB memory limit")
+
+    def merge(self, other):
+        self.last_date = _combine(self.last_date, other.last_date, np.maximum)
+        self.monetary = _combine(self.monetary, other.monetary, np.add)
+        self.pairs.extend(other.pairs)
+        self.pending_pairs += other.stored_pairs + other.pending_pairs
+        if other.fix_date is not None and (self.fix_date is None or other.fix_date > self.fix_date):
+            self.fix_date = other.fix_date
+        return self
+
+    def result(self, fix_date=None):
+        self.compact()
+        frequency = self.pairs[0].groupby('CustomerID').size()
+        table = pd.DataFrame({
+            'recency': self.last_date,
+            'frequency': frequency,
+            'monetary': self.monetary,
+        }).sort_index()
+        table.index = table.index.astype('Int32')
+        table.index.name = 'CustomerID'
+        table['recency'] = rfm.recency_days(fix_date if fix_date is not None else self.fix_date, table['recency'])
+        table['frequency'] = table['frequency'].astype('int64')
+        return table
+# End def #
+
+def _combine(left, right, op):
+    if left.empty:
+        return right
+    left, right = left.align(right)
+    result = pd.Series(op(left.to_numpy(), right.to_numpy()), index=left.index)
+    return result.fillna(left).fillna(right)
+
+### Definition streaming RFM ###
+def _customer_rows(chunk):
+    return chunk[chunk['CustomerID'].notnull()].assign(UnitPrice=lambda rows: prepare.decimal_prices(rows['UnitPrice']))
+
+def clip_bounds(file, schema=ingest.ONLINE_RETAIL_SCHEMA, chunksize=None, columns=CLIP_COLUMNS, epsilon=None):
+    # First pass over the file for the 1%/99% clipping quantiles. Without epsilon they are
+    # exact, from merged value counts (prices and quantities repeat heavily, so the count
+    # tables stay small); with epsilon a KLL sketch bounds memory at that rank error.
+    if epsilon:
+        sketches = {col: QuantileSketch(epsilon) for col in columns}
+    else:
+        counts = {col: None for col in columns}
+    for chunk in ingest.iter_csv(file, schema, chunksize):
+        chunk = _customer_rows(chunk)
+        for col in columns:
+            if epsilon:
+                sketches[col].update(chunk[col].to_numpy(dtype='float64'))
+                continue
+            chunk_counts = chunk[col].astype('float64').value_counts()
+            counts[col] = chunk_counts if counts[col] is None else counts[col].add(chunk_counts, fill_value=0)
+    if epsilon:
+        return {col: iqr_limits(*sketches[col].quantiles(CLIP_QUANTILES)) for col in columns}
+    return {col: iqr_limits(*quantiles_from_counts(counts[col], CLIP_QUANTILES)) for col in columns}
+
+def stream_rfm(file, schema=ingest.ONLINE_RETAIL_SCHEMA, chunksize=None, memory_limit=DEFAULT_MEMORY_LIMIT,
+               bounds=None, quantile_error=None):
+    # Same recency/frequency/monetary table as CleansingData, reading the CSV in chunks
+    chunksize = chunksize or chunksize_for(memory_limit)
+    if bounds is None:
+        bounds = clip_bounds(file, schema, chunksize, epsilon=quantile_error)
+    state = RFMState(memory_limit)
+    for chunk in ingest.iter_csv(file, schema, chunksize):
+        chunk = _customer_rows(chunk)
+        if chunk.empty:
+            continue
+        quantity = chunk['Quantity'].to_numpy(dtype='float64').clip(*bounds['Quantity'])
+        price = chunk['UnitPrice'].to_numpy(dtype='float64').clip(*bounds['UnitPrice'])
+        state.update(chunk[['CustomerID', 'InvoiceNo', 'InvoiceDate']].assign(TotalPrice=quantity * price))
+    return state.result()
+# End def #
@@ -0,0 +1,73 @@
+import pandas as pd
+
+import calendar_features
+import clipping
+import prepare
+
+# Per-upload summaries and chart datasets. Each takes the loaded or prepared data and
+# returns a new frame, never modifying its input, so results can be memoized as
+# pipeline stages and shared between reruns.
+
+### Definition RFM input ###
+def cleanse_for_rfm(df):
+    # Customer rows with Quantity / UnitPrice clipped to the IQR fences and TotalPrice
+    df = df[df['CustomerID'].notnull()].assign(UnitPrice=lambda rows: prepare.decimal_prices(rows['UnitPrice']))
+    clipping.clip_outliers(df, ['Quantity', 'UnitPrice'])
+    if not pd.api.types.is_datetime64_any_dtype(df['InvoiceDate']):
+        df['InvoiceDate'] = pd.to_datetime(df['InvoiceDate'])
+    return df.eval("TotalPrice = Quantity * UnitPrice")
+# End def #
+
+### Definition sales over time ###
+# Chart datasets are roll-ups of the sales cube (cube.SalesCube), never of the rows
+def daily_sales(sales_cube, **filters):
+    sales = sales_cube.query(['Day'], **filters)
+    return pd.DataFrame({'Date': calendar_features.day_labels(sales['Day']), 'TotalSales': sales['TotalSales'].to_numpy()})
+
+def monthly_sales(sales_cube, **filters):
+    sales = sales_cube.query(['Month'], **filters)
+    return pd.DataFrame({'Month': calendar_features.month_labels(sales['Month']), 'TotalSales': sales['TotalSales'].to_numpy()})
+
+def weekday_sales(sales_cube, **filters):
+    sales = sales_cube.query(['Weekday'], **filters).set_index('Weekday')['TotalSales'].reindex(range(7))
+    return pd.DataFrame({'Day of Week': calendar_features.WEEKDAYS, 'Total Sales': sales.to_numpy()})
+
+def time_period_sales(sales_cube, **filters):
+    sales = sales_cube.query(['Period'], **filters)
+    return pd.DataFrame({'TimePeriod': calendar_features.period_labels(sales['Period']), 'TotalSales': sales['TotalSales'].to_numpy()})
+# End def #
+
+### Definition orders and cancellations ###
+def orders_per_country(sales_cube, **filters):
+    # Non-canceled orders per country, counted on the invoice headers
+    orders = sales_cube.query(['Country'], **filters).set_index('Country')['Invoices']
+    orders = orders[orders > 0].sort_values(ascending=False, kind='stable')
+    return orders.rename_axis('Country').rename('count')
+
+def sales_comparison(prepared):
+    return pd.DataFrame({
+        'Status': ['Non-Canceled', 'Canceled'],
+        'Total Sales': [prepared.frame['TotalSales'].sum(), prepared.canceled['TotalSales'].sum()]
+    })
+# End def #
+
+### Definition data summaries ###
+def data_summary(data, prepared):
+    data = data.dropna()
+    return pd.DataFrame([{'Products': data['StockCode'].nunique(),
+                          'Canceled_products': len(prepared.canceled),
+                          'Transactions': data['InvoiceNo'].nunique(),
+                          'Customers': data['CustomerID'].nunique(),
+                          'Countries': data['Country'].nunique()
+                          }], columns=['Products', 'Canceled_products', 'Transactions', 'Customers', 'Countries'], index=['Quantity'])
+
+def invoice_summary(prepared):
+    invoices = prepared.invoices[~prepared.invoices['Canceled']]
+    summary = invoices[['CustomerID', 'InvoiceNo', 'Lines', 'Quantity']].reset_index(drop=True)
+    return summary.rename(columns={'Lines': 'List Product per Invoice', 'Quantity': 'Total Quantity Product'})
+
+def product_summary(sales_cube, **filters):
+    summary = sales_cube.query(['StockCode', 'Description'], **filters)
+    summary = summary[['Description', 'Quantity', 'TotalSales', 'Lines']]
+    return summary.rename(columns={'Quantity': 'Total Quantity', 'TotalSales': 'TotalSales per Product', 'Lines': 'Total orders per product'})
+# End def #